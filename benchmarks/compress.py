@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Response compression, level vs. throughput
+
+Compresses a typical JSON API payload and a rendered HTML page at each
+compression level for every available encoding, reporting the compressed
+size and how many MB of input each level gets through per second. Use it to
+pick the `level` given to `simplerr.compress.Compressor`.
+
+    $ python benchmarks/compress.py
+"""
+
+from pathlib import Path
+import sys
+import timeit
+
+# Identify key project directories and add them to the python search path
+project_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(project_path))
+
+from simplerr.compress import RESPONSE_ENCODINGS, compress  # noqa: E402
+from simplerr.serialise import tojson  # noqa: E402
+
+
+LEVELS = {
+    'gzip': range(1, 10),
+    'deflate': range(1, 10),
+    'br': range(0, 12),
+}
+
+
+def make_json(count):
+    return tojson(
+        {
+            'results': [
+                {
+                    'id': i,
+                    'name': 'Person {}'.format(i),
+                    'email': 'person{}@example.com'.format(i),
+                    'created': '2020-01-01 12:00:{:02d}'.format(i % 60),
+                    'active': i % 3 == 0,
+                }
+                for i in range(count)
+            ]
+        }
+    ).encode('utf-8')
+
+
+def make_html(count):
+    rows = ''.join(
+        '<tr><td>{0}</td><td><a href="/people/{0}">Person {0}</a></td><td>person{0}@example.com</td></tr>\n'.format(i)
+        for i in range(count)
+    )
+
+    return '<html><body><table>\n{}</table></body></html>'.format(rows).encode('utf-8')
+
+
+def main():
+    payloads = [('json', make_json(2000)), ('html', make_html(2000))]
+
+    print("{:<8} {:<8} {:>5} {:>10} {:>8} {:>10}".format("payload", "encoding", "level", "bytes", "ratio", "MB/s"))
+
+    for name, data in payloads:
+        print("{:<8} {:<8} {:>5} {:>10} {:>8} {:>10}".format(name, "identity", "-", len(data), "1.00", "-"))
+
+        for encoding in RESPONSE_ENCODINGS:
+            for level in LEVELS[encoding]:
+                size = len(compress(data, encoding, level))
+
+                seconds = min(timeit.repeat(lambda: compress(data, encoding, level), number=5, repeat=3)) / 5
+                throughput = len(data) / seconds / 1024 / 1024
+
+                print(
+                    "{:<8} {:<8} {:>5} {:>10} {:>8.2f} {:>10.1f}".format(
+                        name, encoding, level, size, len(data) / size, throughput
+                    )
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Route matching latency for view scripts with 10, 100 and 1000 routes
+
+Compares building a new `werkzeug.routing.Map()` on every request (how
+`web.match()` used to work) against reusing a prebuilt `RouteMap`.
+
+    $ python benchmarks/routing.py
+"""
+
+from pathlib import Path
+import sys
+import timeit
+
+from werkzeug.routing import Map, Rule
+from werkzeug.test import EnvironBuilder
+
+# Identify key project directories and add them to the python search path
+project_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(project_path))
+
+from simplerr.web import web, RouteMap  # noqa: E402
+
+
+def make_destinations(count):
+    destinations = []
+
+    for i in range(count):
+        item = web('/items/{}/<int:id>'.format(i))
+        item(lambda request, id: id)
+        destinations.append(item)
+
+    return destinations
+
+
+def rebuild_match(destinations, environ):
+    # Pre RouteMap implementation of web.match()
+    map = Map()
+    index = {}
+
+    for item in destinations:
+        index[item.endpoint] = item
+        map.add(Rule(item.route, endpoint=item.endpoint, methods=item.methods))
+
+    urls = map.bind_to_environ(environ)
+    endpoint, args = urls.match()
+
+    return index[endpoint]
+
+
+def main():
+    print("{:>8} {:>16} {:>16} {:>10}".format("routes", "rebuild (us)", "prebuilt (us)", "speedup"))
+
+    for count in (10, 100, 1000):
+        web.restore_presets()
+        destinations = make_destinations(count)
+        routes = RouteMap(destinations)
+
+        # Worst case for matching, the last route declared
+        environ = EnvironBuilder(path='/items/{}/1'.format(count - 1)).get_environ()
+
+        # Rebuilding is slow enough that a handful of runs is plenty
+        number = max(2, 200 // count)
+        before = min(timeit.repeat(lambda: rebuild_match(destinations, environ), number=number, repeat=3))
+        before = before / number * 1e6
+
+        number = 2000
+        after = min(timeit.repeat(lambda: routes.match(environ), number=number, repeat=3))
+        after = after / number * 1e6
+
+        print("{:>8} {:>16.1f} {:>16.1f} {:>9.0f}x".format(count, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""JSON encoding throughput for `serialise.tojson`
+
+Compares the original `json_serial` fallback (an isinstance chain and two
+MRO name scans per object) against the type registry, with the standard
+library encoder and, when installed, orjson.
+
+    $ python benchmarks/serialise.py
+"""
+
+from pathlib import Path
+from datetime import datetime, date, time
+import json
+import sys
+import timeit
+
+import peewee
+
+# Identify key project directories and add them to the python search path
+project_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(project_path))
+
+from simplerr import serialise  # noqa: E402
+from simplerr.peewee import is_model, is_model_select, model_to_dict  # noqa: E402
+
+
+def legacy_json_serial(obj):
+    # Pre registry implementation of serialise.json_serial()
+    if isinstance(obj, datetime):
+        return obj.isoformat(' ')
+
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+
+    if is_model(obj):
+        return model_to_dict(obj)
+
+    if is_model_select(obj):
+        return [model_to_dict(item) for item in obj]
+
+    return str(obj)
+
+
+db = peewee.SqliteDatabase(':memory:')
+
+
+class Person(peewee.Model):
+    name = peewee.CharField()
+    email = peewee.CharField()
+    born = peewee.DateField()
+    created = peewee.DateTimeField()
+
+    class Meta:
+        database = db
+
+
+def make_people(count):
+    db.create_tables([Person])
+
+    with db.atomic():
+        Person.insert_many(
+            [
+                {
+                    'name': 'Person {}'.format(i),
+                    'email': 'person{}@example.com'.format(i),
+                    'born': date(1980, 1, 1),
+                    'created': datetime(2020, 1, 1, 12, 0, i % 60),
+                }
+                for i in range(count)
+            ]
+        ).execute()
+
+    return list(Person.select())
+
+
+def main():
+    datetimes = [datetime(2020, 1, 1, 12, 0, i % 60) for i in range(100000)]
+    people = make_people(10000)
+
+    encoders = [
+        ('legacy json', lambda data: json.dumps(data, default=legacy_json_serial)),
+        ('registry json', lambda data: json.dumps(data, default=serialise.json_serial)),
+    ]
+
+    if serialise.backend != 'json':
+        encoders.append(('registry ' + serialise.backend, serialise.tojson))
+
+    print("{:<16} {:>18} {:>18}".format("encoder", "100k datetimes ms", "10k peewee rows ms"))
+
+    for name, encode in encoders:
+        times = []
+
+        for data in (datetimes, people):
+            times.append(min(timeit.repeat(lambda: encode(data), number=3, repeat=3)) / 3 * 1000)
+
+        print("{:<16} {:>18.1f} {:>18.1f}".format(name, *times))
+
+
+if __name__ == '__main__':
+    main()
@@ -103,6 +103,7 @@ setup(
     entry_points={
         "console_scripts": [
             "webserv=simplerr.__main__:main",
+            "simplerr=simplerr.__main__:main",
         ],
     },
     zip_safe=False,
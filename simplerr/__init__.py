@@ -8,3 +8,4 @@ from .web import web, make_response
 # Import Grammar Helpers
 from .methods import GET, POST, PUT, DELETE, PATCH
 from .cors import CORS
+from .cache import Cache
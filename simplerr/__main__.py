@@ -0,0 +1,108 @@
+import os
+import sys
+
+import click
+
+from .script import script
+from .assets import Bundle, bundles
+from .template import Template, TEMPLATE_EXTENSIONS
+from .compress import ENCODINGS, MIN_SIZE, precompress as precompress_folder
+
+
+@click.group()
+def main():
+    """Simplerr command line tools"""
+
+
+@main.command("compile-templates")
+@click.argument("site", type=click.Path(exists=True, file_okay=False))
+@click.option("--cache", "cache_dir", required=True, type=click.Path(file_okay=False), help="Bytecode cache folder.")
+@click.option(
+    "--load-scripts/--no-load-scripts",
+    default=True,
+    help="Load the view scripts first so their filters are registered.",
+)
+@click.option("--extension", "extensions", multiple=True, help="Template extensions, may be repeated.")
+def compile_templates(site, cache_dir, load_scripts, extensions):
+    """Compile every template in SITE to the bytecode cache
+
+    Run as part of a deploy so workers start with compiled templates, the
+    same folder should be given to `Simplerr(template_cache=...)`.
+    """
+    cwd = os.path.abspath(site)
+    failed = False
+
+    if load_scripts:
+        # Same search path as `Simplerr`, so scripts can import project modules
+        # and find their asset bundles
+        sys.path.append(cwd)
+        Bundle.root = cwd
+        loaded = script.preload(cwd)
+
+        # Filters registered by a failed script are missing, so keep going to
+        # report any templates using them too
+        for path, error in loaded["errors"]:
+            click.echo(" * Failed to load {}: {!r}".format(path, error), err=True)
+            failed = True
+
+    stats = Template(cwd, cache_dir).precompile(extensions or TEMPLATE_EXTENSIONS)
+
+    for name, error in stats["errors"]:
+        click.echo(" * Failed to compile {}: {}".format(name, error), err=True)
+        failed = True
+
+    click.echo(" * Compiled {} templates in {:.3f}s".format(stats["templates"], stats["seconds"]))
+
+    if failed:
+        sys.exit(1)
+
+
+@main.command("precompress")
+@click.argument("folder", type=click.Path(exists=True, file_okay=False))
+@click.option("--min-size", default=MIN_SIZE, show_default=True, help="Skip files smaller than this many bytes.")
+@click.option(
+    "--encoding", "encodings", multiple=True, type=click.Choice(ENCODINGS), help="Encodings to write, may be repeated."
+)
+def precompress(folder, min_size, encodings):
+    """Write .br and .gz copies of the text files in FOLDER
+
+    File routes send these to clients that accept them instead of the
+    original, so static assets are compressed once per deploy.
+    """
+    stats = precompress_folder(folder, encodings or ENCODINGS, min_size)
+
+    click.echo(
+        " * Compressed {} of {} files, saving {} bytes in {:.3f}s".format(
+            stats["written"], stats["files"], stats["saved"], stats["seconds"]
+        )
+    )
+
+
+@main.command("build-assets")
+@click.argument("site", type=click.Path(exists=True, file_okay=False))
+def build_assets(site):
+    """Build the asset bundles declared by the view scripts in SITE
+
+    Loads every view script, which writes its `web.js()` and `web.css()`
+    bundles, so workers find them already built.
+    """
+    cwd = os.path.abspath(site)
+    Bundle.root = cwd
+
+    sys.path.append(cwd)
+    stats = script.preload(cwd)
+
+    for path, error in stats["errors"]:
+        click.echo(" * Failed to load {}: {!r}".format(path, error), err=True)
+
+    for name, item in sorted(bundles.items()):
+        click.echo(" * {} -> {}".format(name, item.url))
+
+    click.echo(" * Built {} bundles".format(len(bundles)))
+
+    if stats["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import io
+import sys
+import asyncio
+import inspect
+
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wrappers import Response
+from werkzeug.exceptions import MethodNotAllowed
+
+from .web import web
+
+
+class asgi_dispatcher(object):
+    """ASGI application sharing the script resolution and routing of the WSGI
+    `dispatcher`
+
+    Views declared with `async def` are awaited on the event loop, everything
+    else (sync views, events, script loading, template rendering) runs in a
+    bounded thread pool. An async view may also return an async iterator to
+    stream the response body.
+
+    Example usage
+    -------------
+
+    app = Simplerr('website', 'localhost', 8000)
+
+    # Then run with any ASGI server, eg
+    #   $ uvicorn module:app.asgi
+
+    @web('/api/prices')
+    async def prices(request):
+        return {'prices': await fetch_prices()}
+    """
+
+    def __init__(self, wsgi, max_threads=None):
+        self.wsgi = wsgi
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] != "http":
+            raise RuntimeError("Unsupported ASGI scope type {}".format(scope["type"]))
+
+        body = await self.read_body(receive)
+        environ = self.make_environ(scope, body)
+
+        response = await self.handle(environ)
+        await self.send_response(response, environ, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def handle(self, environ):
+        request = self.wsgi.make_request(environ)
+        routes = await self.run(self.wsgi.begin, request)
+
+        try:
+            response = await self.process(request, environ, routes)
+        except Exception as e:
+            response = self.wsgi.handle_exception(request, e)
+
+        response = await self.run(self.wsgi.finish, request, response)
+
+        return response
+
+    async def process(self, request, environ, routes):
+        try:
+            match = web.match(environ, routes)
+        except MethodNotAllowed:
+            return Response(status=405)
+
+        cwd = self.wsgi.cwd
+
+        if not inspect.iscoroutinefunction(match.fn):
+            return await self.run(web.process, request, environ, cwd, routes)
+
+        val = await match.fn(request, **match.args)
+
+        # Async iterators are streamed straight to the client
+        if hasattr(val, "__aiter__"):
+            return Response(val, mimetype=match.mimetype or "text/html", direct_passthrough=True)
+
+        response = await self.run(web.respond, match, val, request, environ, cwd)
+
+        return web.conditional(match, request, response)
+
+    async def read_body(self, receive):
+        body = bytearray()
+
+        while True:
+            message = await receive()
+
+            if message["type"] == "http.disconnect":
+                break
+
+            body.extend(message.get("body", b""))
+
+            if not message.get("more_body", False):
+                break
+
+        return bytes(body)
+
+    def make_environ(self, scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 80),
+            "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "asgi.scope": scope,
+        }
+
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1")
+            value = value.decode("latin1")
+
+            if name == "content-type":
+                key = "CONTENT_TYPE"
+            elif name == "content-length":
+                key = "CONTENT_LENGTH"
+            else:
+                key = "HTTP_{}".format(name.upper().replace("-", "_"))
+
+            # Repeated headers are joined as per the WSGI spec
+            if key in environ:
+                value = "{},{}".format(environ[key], value)
+
+            environ[key] = value
+
+        return environ
+
+    async def send_response(self, response, environ, send):
+        stream = response.response if hasattr(response.response, "__aiter__") else None
+
+        if stream is not None:
+            status, headers = response.status_code, response.get_wsgi_headers(environ).to_wsgi_list()
+        else:
+            app_iter, status, headers = await self.run(response.get_wsgi_response, environ)
+            status = int(status.split(None, 1)[0])
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers],
+            }
+        )
+
+        if stream is not None:
+            if environ["REQUEST_METHOD"] != "HEAD":
+                async for chunk in stream:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode("utf-8")
+
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        elif response.is_sequence:
+            # Already in memory, no need to leave the event loop
+            try:
+                for chunk in app_iter:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+
+        else:
+            await self.run(self.pump, app_iter, send, asyncio.get_running_loop())
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def pump(self, app_iter, send, loop):
+        # Iterate in a single worker thread as some iterators, eg database
+        # cursors, can't move between threads. Waiting on each send gives
+        # back pressure from slow clients.
+        try:
+            for chunk in app_iter:
+                message = {"type": "http.response.body", "body": chunk, "more_body": True}
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
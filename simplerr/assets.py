@@ -0,0 +1,170 @@
+import os
+import re
+import hashlib
+
+from .template import Template
+
+# Optional, better minifiers are used when installed
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+
+# Fingerprinted files never change, so can be cached for a year
+ASSET_MAX_AGE = 31536000
+
+# Bundles by name, and the url of each built bundle by name. The urls are
+# available to templates as `assets`, eg {{ assets.app_js }}
+bundles = {}
+urls = {}
+
+# Absolute paths of the built files, see `is_asset()`
+built = set()
+
+Template.globals["assets"] = urls
+
+
+class Bundle(object):
+    """A set of javascript or css files served as one minified file
+
+    Files are joined in the order given, minified and written to
+    `output_dir` as `<name>.<hash>.<ext>`. The name changes whenever the
+    content does, so the file can be cached by clients forever. Paths are
+    relative to the site, like template paths.
+
+    Usually declared with `web.js()` or `web.css()`, and built when the view
+    script declaring it is loaded, so use `Simplerr(preload=True)` or
+    `simplerr build-assets` to build every bundle at startup or deploy.
+
+    Example usage
+    -------------
+
+    @web.js('app_js', source_dir='/financials/static')
+    def app_js():
+        yield 'app.controller.js'
+        yield 'app.service.js'
+
+    # In a template
+    <script src="{{ assets.app_js }}"></script>
+
+    # And a route to serve it
+    @web('/financials/static/<path:name>', file=True)
+    def static(request, name):
+        return 'financials/static/' + name
+    """
+
+    # The site folder, set by `Simplerr`
+    root = None
+
+    def __init__(self, name, kind, files, source_dir="/", output_dir=None, minify=True):
+        self.name = name
+        self.kind = kind
+        self.files = list(files)
+        self.source_dir = source_dir
+        self.output_dir = source_dir if output_dir is None else output_dir
+        self.minify = minify
+
+        self.path = None
+        self.url = None
+
+    @staticmethod
+    def site_path(path):
+        return os.path.join(Bundle.root or os.getcwd(), path.lstrip("/"))
+
+    def read(self):
+        sources = []
+
+        for name in self.files:
+            with open(os.path.join(Bundle.site_path(self.source_dir), name), encoding="utf-8") as f:
+                sources.append(f.read())
+
+        if self.kind == "js":
+            # Guard against files missing a trailing semicolon
+            content = "\n;\n".join(sources)
+        else:
+            content = "\n".join(sources)
+
+        if self.minify:
+            content = minify_js(content) if self.kind == "js" else minify_css(content)
+
+        return content
+
+    def build(self):
+        """Write the bundle and return its url, an existing file with the
+        same content is reused"""
+        content = self.read().encode("utf-8")
+        fingerprint = hashlib.sha256(content).hexdigest()[:8]
+
+        filename = "{}.{}.{}".format(self.name, fingerprint, self.kind)
+        folder = Bundle.site_path(self.output_dir)
+        path = os.path.join(folder, filename)
+
+        if not os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+
+            # Write then rename, other workers may be building it too
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+
+        self.path = os.path.abspath(path)
+        self.url = "/" + "/".join([self.output_dir.strip("/"), filename]).lstrip("/")
+
+        return self.url
+
+
+def bundle(name, kind, source_dir="/", output_dir=None, minify=True):
+    """Decorator declaring a `Bundle` from a function yielding its files,
+    see `web.js()` and `web.css()`"""
+
+    def wrap(fn):
+        item = Bundle(name, kind, fn(), source_dir, output_dir, minify)
+        item.build()
+
+        # Replace any previous build, eg when the script is reloaded
+        previous = bundles.get(name)
+        if previous is not None:
+            built.discard(previous.path)
+
+        bundles[name] = item
+        urls[name] = item.url
+        built.add(item.path)
+
+        return fn
+
+    return wrap
+
+
+def is_asset(path):
+    """True for a built (fingerprinted) bundle"""
+    return os.path.abspath(path) in built
+
+
+def minify_js(source):
+    # Javascript can't be safely minified without a parser (template
+    # strings, regex literals), so it's only bundled without rjsmin
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+
+    return source
+
+
+def minify_css(source):
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+
+    # Only after a colon, a space before one matters in selectors, eg `a :hover`
+    source = re.sub(r":\s+", ":", source)
+
+    return source.replace(";}", "}").strip()
@@ -0,0 +1,304 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.wrappers import Response
+
+
+class LRUCache(object):
+    """Small thread-safe LRU cache used by the various simplerr caches
+
+    Entries can be bounded by count (`maxsize`), by total size in bytes
+    (`maxbytes`) and by age (`ttl`, in seconds). Sizes are supplied by the
+    caller when setting an item as only the caller knows what an entry costs.
+    `on_evict(value)` is called for every value leaving the cache, whether
+    evicted, expired, replaced, popped or cleared, eg to close a resource.
+
+    Example usage
+    -------------
+
+    cache = LRUCache(maxsize=100, ttl=30)
+    cache.set('key', 'value')
+    cache.get('key')  # -> 'value'
+    """
+
+    def __init__(self, maxsize=None, maxbytes=None, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+        self.data = OrderedDict()
+        self.lock = threading.RLock()
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, default=None, count=True):
+        with self.lock:
+            entry = self.data.get(key)
+
+            if entry is not None and self.is_expired(entry):
+                self.remove(key)
+                entry = None
+
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+
+            self.data.move_to_end(key)
+
+            if count:
+                self.hits += 1
+
+            return entry[0]
+
+    def set(self, key, value, size=0, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+
+        with self.lock:
+            self.remove(key)
+
+            self.data[key] = (value, expires, size)
+            self.bytes += size
+
+            self.evict()
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            self.remove(key)
+
+        return default if entry is None else entry[0]
+
+    def remove(self, key):
+        entry = self.data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+            self.evicted(entry)
+
+    def evict(self):
+        # Oldest entries are at the front of the ordered dict
+        while self.data and (
+            (self.maxsize is not None and len(self.data) > self.maxsize)
+            or (self.maxbytes is not None and self.bytes > self.maxbytes)
+        ):
+            key, entry = self.data.popitem(last=False)
+            self.bytes -= entry[2]
+            self.evicted(entry)
+
+    def evicted(self, entry):
+        if self.on_evict is not None:
+            self.on_evict(entry[0])
+
+    def is_expired(self, entry):
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+    def sweep(self):
+        """Remove expired entries, returns the number of entries removed"""
+        with self.lock:
+            expired = [key for key, entry in self.data.items() if self.is_expired(entry)]
+            for key in expired:
+                self.remove(key)
+
+        return len(expired)
+
+    def export(self):
+        """List of (key, value, seconds to live) for live entries, seconds is
+        `None` for entries that don't expire"""
+        now = time.monotonic()
+        out = []
+
+        with self.lock:
+            for key, (value, expires, _) in self.data.items():
+                if expires is None:
+                    out.append((key, value, None))
+                elif expires > now:
+                    out.append((key, value, expires - now))
+
+        return out
+
+    def keys(self):
+        with self.lock:
+            return list(self.data.keys())
+
+    def clear(self):
+        with self.lock:
+            entries = list(self.data.values())
+            self.data.clear()
+            self.bytes = 0
+
+            for entry in entries:
+                self.evicted(entry)
+
+    def stats(self):
+        return {
+            "size": len(self.data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class Cache(object):
+    """Response caching for a route, see `web(cache=...)`
+
+    Responses are kept for `ttl` seconds. For a further `stale` seconds an
+    expired response is still sent, and the view is run again once it has
+    been sent to refresh it (stale-while-revalidate).
+
+    Responses are cached per route and path, plus either every query
+    argument or, when given, only the request values named in `vary`, eg
+    `'args.region'`, `'headers.Accept-Language'` or `'cookies.theme'`.
+
+    Only successful GET and HEAD responses held in memory are cached, and
+    never ones setting a cookie.
+
+    Example usage
+    -------------
+
+    @web('/prices', cache=Cache(ttl=30, vary=['args.region'], stale=60))
+    def prices(request):
+        return get_prices(request.args.get('region'))
+
+    # After the prices change
+    web.cache.invalidate(route='/prices')
+    """
+
+    def __init__(self, ttl=60, vary=None, stale=0):
+        self.ttl = ttl
+        self.vary = vary
+        self.stale = stale
+
+    def key(self, match, request):
+        if self.vary is None:
+            values = Cache.hashable(request.args)
+        else:
+            values = tuple(Cache.vary_value(request, name) for name in self.vary)
+
+        return (match.route, request.path, values)
+
+    @staticmethod
+    def vary_value(request, name):
+        source, _, item = name.partition(".")
+        value = getattr(request, source, None)
+
+        if item and value is not None:
+            value = value.get(item)
+
+        return Cache.hashable(value)
+
+    @staticmethod
+    def hashable(value):
+        if isinstance(value, MultiDict):
+            return tuple(sorted(value.items(multi=True)))
+
+        if hasattr(value, "items"):
+            return tuple(sorted(value.items()))
+
+        return value
+
+
+class CachedResponse(object):
+    """The parts of a response needed to send it again"""
+
+    def __init__(self, response, ttl):
+        self.status = response.status_code
+        self.headers = [(name, value) for name, value in response.headers if name.lower() != "content-length"]
+        self.body = response.get_data()
+        self.created = time.monotonic()
+        self.ttl = ttl
+
+        self.size = len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+    def age(self):
+        return time.monotonic() - self.created
+
+    def response(self):
+        response = Response(self.body, status=self.status, headers=self.headers)
+        response.headers["Age"] = str(int(self.age()))
+
+        return response
+
+
+class ResponseCache(object):
+    """Responses for routes declared with `cache=Cache(...)`, available as
+    `web.cache`, bounded by the bytes held"""
+
+    def __init__(self, maxbytes=64 * 1024 * 1024, maxsize=None):
+        self.entries = LRUCache(maxsize=maxsize, maxbytes=maxbytes)
+
+        # Keys with a refresh pending, so a stale entry is only refreshed once
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def respond(self, cache, match, request, render):
+        """Cached response for the request, else `render()` and cache it"""
+        if request.method not in ("GET", "HEAD"):
+            return render()
+
+        key = cache.key(match, request)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            response = render()
+            self.store(key, cache, response)
+            return response
+
+        response = entry.response()
+
+        if entry.age() >= entry.ttl:
+            with self.lock:
+                refresh = key not in self.refreshing
+                self.refreshing.add(key)
+
+            # Refresh once the stale response has been sent
+            if refresh:
+                response.call_on_close(lambda: self.refresh(key, cache, render))
+
+        return response
+
+    def refresh(self, key, cache, render):
+        try:
+            self.store(key, cache, render())
+        except Exception:
+            # Keep sending the stale response until it expires, the error
+            # will surface then
+            pass
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def store(self, key, cache, response):
+        if response.status_code != 200 or response.direct_passthrough or not response.is_sequence:
+            return
+
+        if "Set-Cookie" in response.headers or "no-store" in response.headers.get("Cache-Control", ""):
+            return
+
+        entry = CachedResponse(response, cache.ttl)
+        self.entries.set(key, entry, size=entry.size, ttl=cache.ttl + cache.stale)
+
+    def invalidate(self, route=None, path=None):
+        """Remove cached responses for a route and/or path, everything when
+        neither is given"""
+        for key in self.entries.keys():
+            if (route is None or key[0] == route) and (path is None or key[1] == path):
+                self.entries.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return self.entries.stats()
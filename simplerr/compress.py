@@ -0,0 +1,218 @@
+import os
+import gzip
+import zlib
+import time
+import mimetypes
+
+from werkzeug.http import parse_accept_header
+
+# Optional, brotli is only offered when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Supported content codings, in order of preference, with the file suffix
+# used for precompressed copies
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Encodings for dynamic responses, also accepting deflate
+RESPONSE_ENCODINGS = ENCODINGS + ("deflate",)
+
+# Types worth compressing, everything else (images, video, archives) is
+# already compressed
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "image/svg+xml",
+    "image/x-icon",
+)
+
+# Smaller than this and the headers cost more than is saved
+MIN_SIZE = 256
+
+
+def is_compressible(mimetype):
+    if mimetype is None:
+        return False
+
+    mimetype = mimetype.split(";")[0].strip().lower()
+
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES or mimetype.endswith("+json")
+
+
+def negotiate(environ, available=tuple(SUFFIXES)):
+    """Best of the `available` encodings the client accepts, or None"""
+    header = environ.get("HTTP_ACCEPT_ENCODING")
+    if not header:
+        return None
+
+    accept = parse_accept_header(header)
+    best, best_quality = None, 0
+
+    # Ties go to the first available, so list them in order of preference
+    for encoding in available:
+        quality = accept.quality(encoding)
+
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def compress(data, encoding, level=None):
+    if encoding == "gzip":
+        return gzip.compress(data, 6 if level is None else level, mtime=0)
+
+    if encoding == "deflate":
+        return zlib.compress(data, 6 if level is None else level)
+
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if level is None else level)
+
+    raise ValueError("Unsupported encoding {}".format(encoding))
+
+
+def compress_stream(chunks, encoding, level=None):
+    """Compress an iterable of bytes, each chunk is flushed as it's
+    compressed so streamed responses aren't held back"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5 if level is None else level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        # Window bits of 31 writes a gzip header, 15 a zlib one
+        wbits = 31 if encoding == "gzip" else 15
+        compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, wbits)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    try:
+        for chunk in chunks:
+            data = process(chunk) + flush()
+            if data:
+                yield data
+
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+class Compressor(object):
+    """Compresses text responses (JSON, HTML, ...) for clients that accept it
+
+    Responses held in memory are compressed when at least `threshold`
+    bytes, streamed responses are compressed a chunk at a time. File
+    responses (`direct_passthrough`) are left to `send_file()`, as are
+    responses that already have a `Content-Encoding` or aren't a
+    compressible type.
+
+    Example usage
+    -------------
+
+    app = Simplerr('website', 'localhost', 8000, use_compression=Compressor(threshold=512, level=4))
+    """
+
+    def __init__(self, threshold=1024, encodings=RESPONSE_ENCODINGS, level=None):
+        self.threshold = threshold
+        self.encodings = encodings
+        self.level = level
+
+    def __call__(self, environ, response):
+        if response.direct_passthrough or response.status_code in (204, 206, 304) or response.status_code < 200:
+            return response
+
+        if "Content-Encoding" in response.headers or not is_compressible(response.mimetype):
+            return response
+
+        if "no-transform" in response.headers.get("Cache-Control", ""):
+            return response
+
+        # Async streams are sent by the ASGI server as they are
+        if hasattr(response.response, "__aiter__"):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        encoding = negotiate(environ, self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_sequence:
+            data = response.get_data()
+            if len(data) < self.threshold:
+                return response
+
+            response.set_data(compress(data, encoding, self.level))
+        else:
+            response.response = compress_stream(response.iter_encoded(), encoding, self.level)
+            response.headers.pop("Content-Length", None)
+
+        response.headers["Content-Encoding"] = encoding
+
+        # The body is no longer byte for byte what the etag was made from
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+
+def precompress(folder, encodings=ENCODINGS, min_size=MIN_SIZE):
+    """Write .br/.gz copies next to every compressible file in `folder`
+
+    Copies are only written when missing or older than the file, and only
+    kept when they are smaller. `send_file()` serves them to clients that
+    accept the encoding.
+
+    Returns {"files": count, "written": count, "saved": bytes, "seconds": ...}
+    """
+    start = time.perf_counter()
+    files = written = saved = 0
+
+    suffixes = tuple(SUFFIXES.values())
+
+    for root, folders, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if name.endswith(suffixes) or not is_compressible(mimetypes.guess_type(name)[0]):
+                continue
+
+            st = os.stat(path)
+            if st.st_size < min_size:
+                continue
+
+            files += 1
+            data = None
+
+            for encoding in encodings:
+                target = path + SUFFIXES[encoding]
+
+                try:
+                    if os.stat(target).st_mtime_ns >= st.st_mtime_ns:
+                        continue
+                except FileNotFoundError:
+                    pass
+
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+
+                # Best compression, this is done once per deploy
+                packed = compress(data, encoding, 9 if encoding == "gzip" else 11)
+
+                if len(packed) >= len(data):
+                    continue
+
+                with open(target, "wb") as f:
+                    f.write(packed)
+
+                written += 1
+                saved += len(data) - len(packed)
+
+    return {"files": files, "written": written, "saved": saved, "seconds": time.perf_counter() - start}
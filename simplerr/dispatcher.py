@@ -11,7 +11,12 @@ from werkzeug.debug import DebuggedApplication
 
 from .web import web
 from .script import script
+from .server import PreforkServer, WorkerRequestHandler
+from .asgi import asgi_dispatcher
 from .session import FileSystemSessionStore
+from .template import Template
+from .compress import Compressor
+from .assets import Bundle
 from .errors import SiteNotFoundError
 
 
@@ -81,43 +86,60 @@ class WebRequest(Request):
 
 
 class dispatcher(object):
-    def __init__(self, cwd, global_events):
+    def __init__(self, cwd, global_events, compressor=None):
         self.cwd = cwd
         self.global_events = global_events
+        self.compressor = compressor
 
     def __call__(self, environ, start_response):
         """This methods provides the basic call signature required by WSGI"""
-        request = WebRequest(environ)
+        request = self.make_request(environ)
+        routes = self.begin(request)
+
+        # Process Response, and get payload
+        try:
+            response = web.process(request, environ, self.cwd, routes)
+        except Exception as e:
+            response = self.handle_exception(request, e)
+
+        response = self.finish(request, response)
+
+        # There should be no more user code after this being run
+        return response(environ, start_response)
+
+    def make_request(self, environ):
+        return WebRequest(environ)
+
+    def begin(self, request):
+        """Fire pre response events and get the routes for this request"""
 
         # Fire Pre Response Events
         self.global_events.fire_pre_response(request)
         request.view_events.fire_pre_response(request)
 
-        # RestorePresets
-        web.restore_presets()
-
-        # Get view script and view module
+        # Get view script, along with its module and compiled routes
         sc = script(self.cwd, request.path)
-        sc.get_module()
+        return sc.get_routes()
 
-        # Process Response, and get payload
-        try:
-            response = web.process(request, environ, self.cwd)
-        except Exception as e:
-            if hasattr(e, "code") and self.global_events.error_handler.get(e.code) is not None:
-                # Is a werkzeug error and we should handle it
-                response = self.global_events.error_handler[e.code]()
-            else:
-                # Catch all
-                self.global_events.fire_post_exception(request, e)
-                raise e
+    def handle_exception(self, request, e):
+        if hasattr(e, "code") and self.global_events.error_handler.get(e.code) is not None:
+            # Is a werkzeug error and we should handle it
+            return self.global_events.error_handler[e.code]()
+
+        # Catch all
+        self.global_events.fire_post_exception(request, e)
+        raise e
 
+    def finish(self, request, response):
         # Done, fire post response events
         request.view_events.fire_post_response(request, response)
         self.global_events.fire_post_response(request, response)
 
-        # There should be no more user code after this being run
-        return response(environ, start_response)
+        # Compress last, so headers set by events are seen
+        if self.compressor is not None:
+            response = self.compressor(request.environ, response)
+
+        return response
 
 
 class Simplerr(object):
@@ -133,6 +155,16 @@ class Simplerr(object):
         threaded=True,
         processes=1,
         use_profiler=False,
+        preload=False,
+        use_compression=False,
+        use_etags=False,
+        offload=None,
+        template_cache=None,
+        precompile_templates=False,
+        workers=None,
+        max_requests=None,
+        max_rss=None,
+        asgi_threads=None,
     ):
         self.site = site
         self.hostname = hostname
@@ -143,6 +175,11 @@ class Simplerr(object):
         self.threaded = threaded
         self.processes = processes
 
+        # Production prefork server settings, see `serve()`
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_rss = max_rss
+
         self.cwd = self.make_cwd()
 
         # Add Relevent Web Events
@@ -152,19 +189,60 @@ class Simplerr(object):
         # object unless you want the event called at every view.
         self.global_events = WebEvents()
 
-        # Add session events to pre and post response
+        # Add session events to pre and post response, a store instance may
+        # be given in place of the default filesystem store
         if use_session_store is True:
-            self.session_store = FileSystemSessionStore()
+            use_session_store = FileSystemSessionStore()
+
+        if use_session_store not in (False, None):
+            self.session_store = use_session_store
             self.global_events.on_pre_response(self.session_store.pre_response)
             self.global_events.on_post_response(self.session_store.post_response)
 
         # Add CWD to search path, this is where project modules will be located
         sys.path.append(self.cwd.absolute().__str__())
 
+        # Validate JSON and template responses for every route, routes may
+        # still opt out with `@web(..., etag=False)`
+        if use_etags is True:
+            web.etag = True
+
+        # Let the front end server send files, see `simplerr.static.Offload`
+        if offload is not None:
+            web.offload = offload
+
+        # Asset bundles are written relative to the site
+        Bundle.root = self.cwd.absolute().__str__()
+
+        # Compiled templates are kept on disk when a cache folder is given,
+        # see `simplerr compile-templates`
+        if template_cache is not None:
+            Template.cache_dir = template_cache
+
+        # Production sites can load every view script up front
+        if preload is True:
+            self.preload()
+
+        # And compile every template, after preloading so filters registered
+        # by view scripts are available
+        if precompile_templates is True:
+            self.precompile_templates()
+
         # The actual WSGI application. Applied here to allow for middleware
         # e.g With socketio:
         # app.wsgi = socketio.WSGIApp(sio, app.wsgi)
-        self.wsgi = dispatcher(self.cwd.absolute().__str__(), self.global_events)
+        # Compress responses, a `Compressor` instance may be given in place of
+        # the default settings
+        if use_compression is True:
+            use_compression = Compressor()
+
+        self.wsgi = dispatcher(
+            self.cwd.absolute().__str__(), self.global_events, use_compression or None
+        )
+
+        # ASGI application sharing the same dispatcher, sync views run in a
+        # pool of at most `asgi_threads` threads
+        self.asgi = asgi_dispatcher(self.wsgi, max_threads=asgi_threads)
 
     def pre_response(self, m):
         self.global_events.on_pre_response(m)
@@ -200,6 +278,39 @@ class Simplerr(object):
 
         return decorator
 
+    def preload(self):
+        """Load every view script in the site and compile their routes
+
+        After preloading, requests are resolved and routed without touching
+        the filesystem, so new or edited scripts are not picked up.
+        """
+        stats = script.preload(self.cwd.absolute().__str__())
+
+        for path, error in stats["errors"]:
+            print(" * Failed to preload {}: {!r}".format(path, error))
+
+        print(
+            " * Preloaded {} scripts with {} routes in {:.3f}s".format(
+                stats["scripts"], stats["routes"], stats["seconds"]
+            )
+        )
+
+        return stats
+
+    def precompile_templates(self):
+        """Compile every template in the site before the first request"""
+        cwd = self.cwd.absolute().__str__()
+
+        web.template_engine = web.template_engine or Template(cwd)
+        stats = web.template_engine.precompile()
+
+        for name, error in stats["errors"]:
+            print(" * Failed to compile {}: {}".format(name, error))
+
+        print(" * Compiled {} templates in {:.3f}s".format(stats["templates"], stats["seconds"]))
+
+        return stats
+
     def make_cwd(self):
         path_site = Path(self.site)
         path_with_cwd = Path.cwd() / path_site
@@ -213,13 +324,47 @@ class Simplerr(object):
         raise SiteNotFoundError(self.site, "Could not access folder")
 
     def serve(self):
-        """Start a new development server."""
+        """Start a new server
+
+        When `workers` is set a production prefork server is started, see
+        `simplerr.server.PreforkServer`, otherwise the werkzeug development
+        server is used.
+        """
+        if self.workers:
+            return self.serve_prefork()
+
+        app, sendfile = self.wsgi, True
+
+        # The debugger iterates responses itself, so files can't be sent with
+        # sendfile behind it
+        if self.use_debugger is True:
+            app, sendfile = DebuggedApplication(app, evalex=True), False
+
         run_simple(
             self.hostname,
             self.port,
-            DebuggedApplication(self.wsgi, evalex=True),
+            WorkerRequestHandler.application(app, sendfile),
             use_reloader=self.use_reloader,
-            use_debugger=self.use_debugger,
             threaded=self.threaded,
             processes=self.processes,
+            request_handler=WorkerRequestHandler,
+        )
+
+    def serve_prefork(self):
+        """Start the production prefork server, blocks until stopped."""
+        app, sendfile = self.wsgi, True
+
+        # Never expose the debugger in production unless explicitly asked
+        if self.use_debugger is True:
+            app, sendfile = DebuggedApplication(app, evalex=self.use_evalex), False
+
+        server = PreforkServer(
+            app,
+            self.hostname,
+            self.port,
+            workers=self.workers,
+            max_requests=self.max_requests,
+            max_rss=self.max_rss,
+            sendfile=sendfile,
         )
+        server.serve_forever()
@@ -22,23 +22,166 @@ def is_foreign_key(field):
     return has_base(field, 'ForeignKeyField')
 
 
-def model_to_dict(model):
+# Maximum number of ids in a single `IN (...)` when prefetching, keeps us
+# well under sqlite's bound parameter limit
+PREFETCH_CHUNK_SIZE = 500
+
+
+class ModelPlan(object):
+    """Serialisation plan for a model class
+
+    Computed once per class, see `plan()`, so `model_to_dict` doesn't have to
+    inspect every field of every row.
+    """
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.pk = model_class._meta.primary_key
+
+        # (name, field) pairs, field is only set for foreign keys
+        self.fields = []
+        self.foreign_keys = []
+
+        for field in model_class._meta.sorted_fields:
+            if is_foreign_key(field):
+                self.fields.append((field.name, field))
+                self.foreign_keys.append(field)
+            else:
+                self.fields.append((field.name, None))
+
+    def key(self, model):
+        # Identifies a row, used to spot cycles
+        if self.pk is False or self.pk is None:
+            return (self.model_class, id(model))
+
+        return (self.model_class, model.__data__.get(self.pk.name))
+
+
+# Plans by model class
+plans = {}
+
+
+def plan(model_class):
+    model_plan = plans.get(model_class)
+
+    if model_plan is None:
+        model_plan = plans[model_class] = ModelPlan(model_class)
+
+    return model_plan
+
+
+def model_to_dict(model, max_depth=None, parents=()):
     """
     Simple model_to_dict -- with recuse forever as default
+
+    Foreign keys are nested up to `max_depth` levels deep, after which (and
+    whenever a row refers back to one of its `parents`) the raw key is used.
     """
+    model_plan = plan(model.__class__)
+    parents = parents + (model_plan.key(model),)
+
     data = {}
 
-    for field in model._meta.sorted_fields:
+    for name, field in model_plan.fields:
 
-        field_data = model.__data__.get(field.name)
+        field_data = model.__data__.get(name)
 
-        if is_foreign_key(field):
-            if field_data:
-                rel_obj = getattr(model, field.name)
-                field_data = model_to_dict(rel_obj)
-            else:
+        if field is not None:
+            if not field_data:
                 field_data = None
+            elif max_depth is None or max_depth > 0:
+                # Use the row loaded by a join or prefetch, else query it
+                rel_obj = model.__rel__.get(name)
+                if rel_obj is None:
+                    rel_obj = getattr(model, name)
 
-        data[field.name] = field_data
+                if plan(rel_obj.__class__).key(rel_obj) not in parents:
+                    depth = None if max_depth is None else max_depth - 1
+                    field_data = model_to_dict(rel_obj, depth, parents)
+
+        data[name] = field_data
 
     return data
+
+
+def models_to_dicts(models, max_depth=None):
+    """model_to_dict for many rows, eg a ModelSelect
+
+    Related rows are loaded up front with one query per foreign key per level
+    (see `prefetch_related`) rather than a query per row.
+    """
+    models = list(models)
+    prefetch_related(models, max_depth)
+
+    return [model_to_dict(model, max_depth) for model in models]
+
+
+def prefetch_related(models, max_depth=None):
+    """Batch load the rows foreign keys refer to, up to max_depth levels
+
+    Loaded rows are attached to each model the same way a join would, so
+    peewee and `model_to_dict` use them without querying again.
+    """
+    loaded = {}
+
+    for model in models:
+        loaded[plan(model.__class__).key(model)] = model
+
+    depth = max_depth
+
+    while models and (depth is None or depth > 0):
+        fetched = []
+
+        for field, rows in foreign_key_groups(models):
+            rel_model = field.rel_model
+            rel_plan = plan(rel_model)
+            rel_name = field.rel_field.name
+
+            # Only query rows we haven't already seen, which also stops
+            # cyclic references loading forever. Seen rows can only be
+            # found by their primary key.
+            by_pk = field.rel_field is rel_model._meta.primary_key
+
+            related = {}
+            missing = []
+
+            for i in set(model.__data__[field.name] for model in rows):
+                obj = loaded.get((rel_model, i)) if by_pk else None
+
+                if obj is None:
+                    missing.append(i)
+                else:
+                    related[i] = obj
+
+            for start in range(0, len(missing), PREFETCH_CHUNK_SIZE):
+                chunk = missing[start:start + PREFETCH_CHUNK_SIZE]
+
+                for obj in rel_model.select().where(field.rel_field.in_(chunk)):
+                    key = rel_plan.key(obj)
+                    if key in loaded:
+                        obj = loaded[key]
+                    else:
+                        loaded[key] = obj
+                        fetched.append(obj)
+
+                    related[obj.__data__.get(rel_name)] = obj
+
+            for model in rows:
+                obj = related.get(model.__data__[field.name])
+                if obj is not None:
+                    model.__rel__[field.name] = obj
+
+        models = fetched
+        depth = None if depth is None else depth - 1
+
+
+def foreign_key_groups(models):
+    # Group rows needing a related row by foreign key field
+    groups = {}
+
+    for model in models:
+        for field in plan(model.__class__).foreign_keys:
+            if model.__data__.get(field.name) and field.name not in model.__rel__:
+                groups.setdefault(field, []).append(model)
+
+    return groups.items()
@@ -1,7 +1,15 @@
 from pathlib import Path
+import os
+import time
+import threading
 import importlib.util
 
+from stat import S_ISDIR
+
 from werkzeug.exceptions import HTTPException, NotFound
+
+from .cache import LRUCache
+from .web import web, RouteMap
 """
 TODO: Review werkzeug.utils.find_modules
 
@@ -25,74 +33,304 @@ Returns:
 """
 
 
-class script(object):
+class ScriptIndex(object):
+    """Cache of the view scripts and sub folders in each site folder
 
-    # Set path to root of project
-    # cwd = '/var/www/example.com'
-    #
-    # Route paths always maps to a physical files, as this is part of the
-    # design
-    #
-    # route = '/'
+    Resolving a route walks the site folder from the deepest path segment
+    upwards testing for `.py` and `index.py` files. Each folder is listed
+    once and its scripts and sub folders kept, so resolving a route, even a
+    new one such as a bot scanning `/wp-admin/<anything>`, is a few set
+    lookups rather than a stat per segment.
 
-    def __init__(self, cwd, route):
-        self.cwd = Path(cwd)
-        self.route = Path("." + route)
+    Folder modification times change whenever a file is added, removed or
+    renamed inside them, so listings are revalidated against them at most
+    every `revalidate` seconds. Set `revalidate` to `None` to never
+    revalidate, eg in production, and call `clear()` from a file watcher if
+    scripts are added at run time. See `script.preload()` to avoid the
+    filesystem altogether.
 
-    def get_script(self):
+    `hits` counts resolutions answered from the listings alone, `misses`
+    those that had to list a folder.
+    """
+
+    def __init__(self, maxsize=10000, revalidate=1.0):
+        self.revalidate = revalidate
+
+        # (mtime, script names without '.py', sub folder names, checked) by folder
+        self.entries = LRUCache(maxsize=maxsize)
+
+        # Once the site is preloaded only the listings made then are used
+        self.preloaded = False
+
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, cwd, parts):
+        """Absolute path of the script for a route's parts, None for a miss"""
+        cwd = os.path.abspath(cwd)
+        listed = []
+
+        path = self.find(cwd, parts, listed)
+
+        if listed:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return path
+
+    def find(self, cwd, parts, listed):
         # Examples
         #  /var/www/example.com/app/login
         #  /var/www/example.com/app/login/
         #  /var/www/example.com/app/login/exit
         #  /var/www/example.com/app/login/exit/1
 
-        # Maximum search path, start the top of the
-        # route and continue down. By using route
-        # we ensure we don't dig deaper then the
-        # web path (cwd).
+        # Listings of the site folder and of each route segment that is a
+        # folder, a script can't be any deeper. By using route we ensure we
+        # don't dig deaper then the web path (cwd).
+        entry = self.listing(cwd, listed)
+        if entry is None:
+            return None
 
-        # We also use pathlibs for a more OO view of the filesystem
-        max_depth = self.route.parts.__len__()
+        listings = [entry]
+        folder = cwd
 
-        # First edge case, were calling site root '/', path treats this as 0 length
-        # so it wont go into search loop below
-        if max_depth == 0:
-            root_index_py = self.cwd / 'index.py'
-            if root_index_py.exists():
-                return root_index_py.absolute().__str__()
+        for part in parts:
+            if part not in entry[2]:
+                break
+
+            folder = os.path.join(folder, part)
+            entry = self.listing(folder, listed)
+
+            if entry is None:
+                break
 
-        for i in range(max_depth,0,-1):
-            search = self.route.parts[:i]
-            search_path = self.cwd / Path(*search)
+            listings.append(entry)
+
+        depth = len(listings) - 1
+
+        # First edge case, were calling site root '/', there are no segments
+        # so it wont go into search loop below
+        if not parts:
+            return os.path.join(cwd, "index.py") if "index" in listings[0][1] else None
 
+        # Start at the top of the route and continue down
+        for i in range(min(len(parts), depth + 1), 0, -1):
             # Is this a script file without the '.py'
             # eg, test for ..mple.com/app/login -> ..mple.com/app/login.py
-            script_py_str = ''.join([search_path.__str__(), ".py"])
-            script_py = Path(script_py_str)
-
-            if script_py.exists():
-                return script_py.absolute().__str__()
+            if parts[i - 1] in listings[i - 1][1]:
+                return os.path.join(cwd, *parts[:i]) + ".py"
 
             # Is this a folder with index.py
             # eg, test for ..mpl.com/app/login/index.py
-            index_py = search_path / 'index.py'
-            if index_py.exists():
-                return index_py.absolute().__str__()
+            if i <= depth and "index" in listings[i][1]:
+                return os.path.join(cwd, *parts[:i], "index.py")
 
             # Parent folder "/app/" cant be a py file ("/.py") but can contain an
             # index.py file ("/index.py") so if i==1 then we have to test for
             # this final edge case. Note, application root is different to site
             # route and needs a different edge test
-            if i != 1:
-                continue
+            if i == 1 and "index" in listings[0][1]:
+                return os.path.join(cwd, "index.py")
+
+        return None
+
+    def listing(self, folder, listed):
+        """Listing of a folder, None if it isn't one. Folders read from disk
+        are appended to `listed`"""
+        entry = self.entries.get(folder, count=False)
+
+        if entry is not None:
+            if self.revalidate is None or time.monotonic() - entry[3] <= self.revalidate:
+                return entry
+
+            if ScriptIndex.folder_mtime(folder) == entry[0]:
+                entry = entry[:3] + (time.monotonic(),)
+                self.entries.set(folder, entry)
+                return entry
+
+        elif self.preloaded:
+            return None
+
+        listed.append(folder)
+
+        entry = ScriptIndex.scan(folder)
+        if entry is not None:
+            self.entries.set(folder, entry)
+
+        return entry
+
+    def preload(self, cwd, files):
+        """Use listings made from these files from now on, rather than the
+        filesystem"""
+        cwd = os.path.abspath(cwd)
+        listings = {cwd: (set(), set())}
+
+        for path in files:
+            folder, name = os.path.split(path)
+            listings.setdefault(folder, (set(), set()))[0].add(name[:-3])
+
+            # Make sure every folder on the way is listed in its parent
+            while folder != cwd and folder.startswith(cwd):
+                folder, name = os.path.split(folder)
+                listings.setdefault(folder, (set(), set()))[1].add(name)
+
+        self.clear()
+        self.entries.maxsize = None
+        self.revalidate = None
+        self.preloaded = True
+
+        for folder, (scripts, folders) in listings.items():
+            self.entries.set(folder, (None, frozenset(scripts), frozenset(folders), 0))
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @staticmethod
+    def scan(folder):
+        # Modification time first, so a change made while listing is picked
+        # up by the next revalidation
+        mtime = ScriptIndex.folder_mtime(folder)
+        if mtime is None:
+            return None
+
+        scripts = []
+        folders = []
+
+        try:
+            with os.scandir(folder) as items:
+                for item in items:
+                    if item.is_dir():
+                        folders.append(item.name)
+                    elif item.name.endswith(".py"):
+                        scripts.append(item.name[:-3])
+        except OSError:
+            return None
+
+        return (mtime, frozenset(scripts), frozenset(folders), time.monotonic())
+
+    @staticmethod
+    def folder_mtime(folder):
+        """Modification time of a folder, None if it isn't one"""
+        try:
+            st = os.stat(folder)
+        except OSError:
+            return None
+
+        return st.st_mtime_ns if S_ISDIR(st.st_mode) else None
+
+
+class ModuleCache(object):
+    """Cache of executed view scripts keyed on their absolute path
+
+    Executing a view script re-reads and re-compiles the file and re-runs
+    every `@web` decorator in it, so the module is kept along with the routes
+    it registered. By default entries are revalidated against the file's
+    modification time and size on every lookup, set `revalidate` to `False`
+    in production to never touch the filesystem again.
+
+    The routes are kept as a compiled `RouteMap` so the werkzeug rules are
+    only built once per script. Each script has its own routes, nothing is
+    shared through the global `web.destinations` list.
+    """
+
+    def __init__(self, revalidate=True):
+        self.revalidate = revalidate
+        self.modules = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
 
-            root_index_py = search_path.parent / 'index.py'
-            if root_index_py.exists():
-                return root_index_py.absolute().__str__()
+    def get(self, path, count=True):
+        entry = self.modules.get(path)
 
-        raise NotFound('Could not find matching site file')
+        if entry is not None and self.revalidate:
+            if entry[2] != ModuleCache.stat_file(path):
+                entry = None
+
+        if not count:
+            return entry
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def set(self, path, module, routes, stat):
+        entry = (module, routes, stat)
+        self.modules[path] = entry
+        return entry
+
+    def clear(self):
+        self.modules = {}
+
+    def stats(self):
+        return {
+            "size": len(self.modules),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @staticmethod
+    def stat_file(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+
+class script(object):
+
+    # Set path to root of project
+    # cwd = '/var/www/example.com'
+    #
+    # Route paths always maps to a physical files, as this is part of the
+    # design
+    #
+    # route = '/'
+
+    # Route to script resolutions, shared by all instances
+    index = ScriptIndex()
+
+    # Executed view scripts, shared by all instances
+    modules = ModuleCache()
+
+    def __init__(self, cwd, route):
+        self.cwd = Path(cwd)
+        self.route = Path("." + route)
+
+    def get_script(self):
+        # Resolved from the folder listings in the index, so repeat requests
+        # don't walk the filesystem again
+        path = script.index.resolve(self.cwd.__str__(), self.route.parts)
+
+        if path is None:
+            raise NotFound('Could not find matching site file')
+
+        return path
 
     def get_module(self):
+        module, _ = self.get_entry()
+        return module
+
+    def get_routes(self):
+        _, routes = self.get_entry()
+        return routes
+
+    def get_entry(self):
         # https://www.blog.pythonlibrary.org/2016/05/27/python-201-an-intro-to-importlib/
         # https://docs.python.org/3/library/importlib.html
 
@@ -101,12 +339,95 @@ class script(object):
         # import importlib
         # module = importlib.import_module('abc')
 
-        script = self.get_script()
-        spec = importlib.util.spec_from_file_location("", script)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        return script.load(self.get_script())
+
+    @staticmethod
+    def load(script_path):
+        entry = script.modules.get(script_path)
+
+        if entry is None:
+            with script.modules.lock:
+                # Another thread may have loaded it while this one waited
+                entry = script.modules.get(script_path, count=False)
+
+                if entry is None:
+                    # Stat before executing so an edit made while loading is
+                    # picked up on the next request
+                    stat = ModuleCache.stat_file(script_path)
+
+                    # Collect the routes registered by this script only
+                    token = web.loading.set([])
+                    try:
+                        module = script.load_module(script_path)
+                        routes = RouteMap(web.loading.get())
+                    finally:
+                        web.loading.reset(token)
+
+                    entry = script.modules.set(script_path, module, routes, stat)
+
+        module, routes, _ = entry
 
         # You can no do this
         #   app = module.application()
 
+        return module, routes
+
+    @staticmethod
+    def load_module(script_path):
+        spec = importlib.util.spec_from_file_location("", script_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
         return module
+
+    @staticmethod
+    def find_files(cwd):
+        """All view scripts below cwd, skipping hidden and private folders"""
+        files = []
+
+        for root, dirs, names in os.walk(cwd):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '_')))
+
+            for name in sorted(names):
+                if name.endswith('.py') and not name.startswith(('.', '_')):
+                    files.append(os.path.abspath(os.path.join(root, name)))
+
+        return files
+
+    @staticmethod
+    def preload(cwd):
+        """Load every view script below cwd and stop watching the filesystem
+
+        Each script is executed and its routes compiled up front, and from
+        then on scripts are resolved against the files found here rather than
+        the filesystem. Scripts that fail to load are reported and left to be
+        loaded, and fail, on request as usual.
+
+        Returns a dict of the scripts and routes loaded, any errors and the
+        time taken.
+        """
+        started = time.monotonic()
+
+        files = script.find_files(cwd)
+
+        script.index.preload(cwd, files)
+        script.modules.revalidate = False
+
+        routes = 0
+        errors = []
+
+        for path in files:
+            try:
+                _, script_routes = script.load(path)
+            except Exception as e:
+                errors.append((path, e))
+                continue
+
+            routes += len(script_routes.destinations)
+
+        return {
+            "scripts": len(files) - len(errors),
+            "routes": routes,
+            "errors": errors,
+            "seconds": time.monotonic() - started,
+        }
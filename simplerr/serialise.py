@@ -1,33 +1,148 @@
-from .peewee import is_model, is_model_select, model_to_dict
+from .peewee import model_to_dict, models_to_dicts
 
 # We need custom json_serial to handle date time - not supported
 # by the default json_dumps
 #
 # See https://stackoverflow.com/questions/11875770/how-to-overcome-datetime-datetime-not-json-serializable
 
+import os
 import json
 from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
 
+# Optional accelerated encoders, picked once at import time. Set the
+# SIMPLERR_JSON environment variable to 'orjson', 'ujson' or 'json' to force
+# a backend.
+backend = os.environ.get("SIMPLERR_JSON")
 
-# TODO: All serialisable items need to have a obj.todict() method, otheriwse
-# str(obj) will be used.
+if backend in (None, "orjson"):
+    try:
+        import orjson
+
+        backend = "orjson"
+    except ImportError:
+        orjson = None
+
+if backend in (None, "ujson"):
+    try:
+        import ujson
+
+        backend = "ujson"
+    except ImportError:
+        ujson = None
+
+if backend not in ("orjson", "ujson"):
+    backend = "json"
+
+
+# Serialisers registered against an exact type, see `serialiser()`
+serialisers = {}
+
+# The serialiser resolved for each class seen so far, so the MRO is only
+# walked once per class rather than for every object
+resolved = {}
+resolved_strict = {}
+
+
+def register(cls, fn):
+    """Use fn(obj) to serialise objects of type cls and its subclasses"""
+    serialisers[cls] = fn
+    resolved.clear()
+    resolved_strict.clear()
+
+
+def serialiser(cls):
+    """Decorator form of `register()`, for example
+
+    @serialiser(Money)
+    def money(obj):
+        return {'amount': str(obj.amount), 'currency': obj.currency}
+    """
+
+    def wrap(fn):
+        register(cls, fn)
+        return fn
+
+    return wrap
+
+
+def unserialisable(obj):
+    raise TypeError("Object of type {} is not JSON serializable".format(obj.__class__.__name__))
+
+
+def resolve(cls, fallback=str):
+    for base in cls.__mro__:
+        if base in serialisers:
+            return serialisers[base]
+
+    # Peewee helpers, matched on name so we don't need peewee as a dependancy
+    names = [base.__name__ for base in cls.__mro__]
+
+    if "Model" in names:
+        return model_to_dict
+
+    if "ModelSelect" in names:
+        return models_to_dicts
+
+    if hasattr(cls, "to_dict"):
+        return lambda obj: obj.to_dict()
+
+    return fallback
+
+
+# All serialisable items should have a obj.to_dict() method or a registered
+# serialiser, otheriwse str(obj) will be used.
 def json_serial(obj):
     """JSON serializer for objects not serializable by default json code"""
+    cls = obj.__class__
+
+    fn = resolved.get(cls)
+    if fn is None:
+        fn = resolved[cls] = resolve(cls)
+
+    return fn(obj)
+
+
+def strict_serial(obj):
+    """Same as `json_serial()` but raises a `TypeError` for objects without a
+    registered serialiser, rather than falling back to str(obj)"""
+    cls = obj.__class__
+
+    fn = resolved_strict.get(cls)
+    if fn is None:
+        fn = resolved_strict[cls] = resolve(cls, unserialisable)
+
+    return fn(obj)
+
+
+register(datetime, lambda obj: obj.isoformat(" "))
+register(date, lambda obj: obj.isoformat())
+register(time, lambda obj: obj.isoformat())
+register(Decimal, str)
+register(UUID, str)
 
-    if isinstance(obj, datetime):
-        return obj.isoformat(' ')
 
-    if isinstance(obj, (date, time)):
-        return obj.isoformat()
+if backend == "orjson":
+    # Dates and dataclasses are passed through to json_serial so the output
+    # matches the standard library encoder
+    ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
 
-    if is_model(obj):
-        return model_to_dict(obj)
+    def tojson(data):
+        try:
+            return orjson.dumps(data, default=json_serial, option=ORJSON_OPTIONS).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # eg integers larger than 64 bits
+            return json.dumps(data, default=json_serial)
 
-    if is_model_select(obj):
-        return [model_to_dict(item) for item in obj]
+elif backend == "ujson":
 
-    return str(obj)
+    def tojson(data):
+        return ujson.dumps(data, default=json_serial, ensure_ascii=False)
 
+else:
 
-def tojson(data):
-    return json.dumps(data, default=json_serial)
+    def tojson(data):
+        return json.dumps(data, default=json_serial)
@@ -0,0 +1,312 @@
+import gc
+import os
+import sys
+import time
+import signal
+import socket
+import resource
+import functools
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+def rss():
+    """Resident set size of the current process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        pass
+
+    # No procfs, fall back to the peak RSS which is reported in kilobytes on
+    # linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class SendfileWrapper(object):
+    """`wsgi.file_wrapper` that lets the server send files with
+    `socket.sendfile()`
+
+    Iterating the wrapper reads the file like any other, so middleware that
+    consumes the body still gets the bytes. Only when the server is given
+    the wrapper itself back is the file copied to the socket by the kernel,
+    see `WorkerRequestHandler.application()`.
+    """
+
+    def __init__(self, handler, file, block_size=8192):
+        self.handler = handler
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.file.read(self.block_size), b"")
+
+    def close(self):
+        self.file.close()
+
+
+class WorkerRequestHandler(WSGIRequestHandler):
+    """Request handler used by the prefork workers, and the development
+    server, adding `SendfileWrapper` as `wsgi.file_wrapper`
+
+    Servers using this handler should run `WorkerRequestHandler.application(app)`
+    so file wrappers returned by the app are sent with `sendfile()`.
+    """
+
+    @staticmethod
+    def application(app, sendfile=True):
+        """Wrap the outermost app, sending any `SendfileWrapper` it returns
+        with the handler that created it
+
+        Pass `sendfile=False` when the app iterates responses itself (eg the
+        debugger), `wsgi.file_wrapper` is then left out of the environ so
+        files are sent from memory maps rather than read in Python.
+        """
+
+        def application(environ, start_response):
+            if not sendfile:
+                environ.pop("wsgi.file_wrapper", None)
+
+            app_iter = app(environ, start_response)
+
+            if isinstance(app_iter, SendfileWrapper):
+                return app_iter.handler.sendfile(app_iter)
+
+            return app_iter
+
+        return application
+
+    def make_environ(self):
+        environ = super(WorkerRequestHandler, self).make_environ()
+        environ["wsgi.file_wrapper"] = functools.partial(SendfileWrapper, self)
+
+        self.chunked = False
+
+        return environ
+
+    def sendfile(self, wrapper):
+        try:
+            # An empty chunk first so werkzeug sends the status and headers
+            yield b""
+
+            # Sendfile can't write chunk headers
+            if self.chunked:
+                yield from wrapper
+                return
+
+            self.connection.sendfile(wrapper.file)
+        finally:
+            wrapper.close()
+
+    def send_header(self, keyword, value):
+        # Sendfile can't write chunk headers, so note when werkzeug uses them
+        if keyword.lower() == "transfer-encoding" and value.lower() == "chunked":
+            self.chunked = True
+
+        super(WorkerRequestHandler, self).send_header(keyword, value)
+
+
+class WorkerWSGIServer(BaseWSGIServer):
+    """WSGI server run by each worker on the socket shared by the master
+
+    Handles one request at a time and counts them so the worker knows when it
+    is due to be recycled.
+    """
+
+    multiprocess = True
+
+    def __init__(self, *args, **kwargs):
+        self.requests = 0
+        super(WorkerWSGIServer, self).__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        self.requests += 1
+        super(WorkerWSGIServer, self).process_request(request, client_address)
+
+
+class PreforkServer(object):
+    """Preforking production server
+
+    The master binds a single listening socket, with `SO_REUSEPORT` where
+    available so a new master can be started alongside an old one during a
+    deploy, then forks `workers` processes which all accept on it. Load the
+    site before calling `serve_forever()` (see `Simplerr(preload=True)`) and
+    the workers share its memory copy-on-write.
+
+    Files are sent with `sendfile()` unless `sendfile` is False, see
+    `WorkerRequestHandler.application()`.
+
+    Workers that exit are replaced. A worker retires itself after handling
+    `max_requests` requests or once its RSS grows beyond `max_rss` bytes.
+
+    Signals sent to the master:
+
+        SIGTERM, SIGINT     Stop the workers gracefully and exit
+        SIGHUP              Gracefully replace every worker
+    """
+
+    # Seconds a worker waits on the socket before checking if it should stop
+    poll_interval = 1.0
+
+    # Workers dying quicker than this are assumed to be failing on start up
+    min_lifetime = 1.0
+
+    def __init__(
+        self, app, hostname, port, workers=None, max_requests=None, max_rss=None, backlog=2048, sendfile=True
+    ):
+        self.app = app
+        self.sendfile = sendfile
+        self.hostname = hostname
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.max_rss = max_rss
+        self.backlog = backlog
+
+        self.socket = None
+        self.children = {}
+        self.running = False
+        self.alive = True
+
+    def bind(self):
+        info = socket.getaddrinfo(self.hostname, self.port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)
+        family, type_, proto, _, address = info[0]
+
+        sock = socket.socket(family, type_, proto)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind(address)
+        sock.listen(self.backlog)
+        sock.set_inheritable(True)
+
+        self.socket = sock
+        return sock
+
+    def serve_forever(self):
+        # The socket may already be bound, eg to find the port when binding
+        # to port 0
+        if self.socket is None:
+            self.bind()
+
+        self.running = True
+
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        print(
+            " * Running on http://{}:{}/ with {} workers (pid {})".format(
+                self.hostname, self.socket.getsockname()[1], self.workers, os.getpid()
+            )
+        )
+
+        # Keep objects loaded by the master out of the collector, otherwise
+        # the first collection in each worker touches, and copies, every page
+        if hasattr(gc, "freeze"):
+            gc.collect()
+            gc.freeze()
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        try:
+            self.monitor()
+        finally:
+            self.socket.close()
+
+    def monitor(self):
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+
+            if os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0:
+                print(" * Worker {} died unexpectedly (status {})".format(pid, status))
+
+            if not self.running:
+                continue
+
+            # Back off rather than fork bomb when workers can't start
+            if time.monotonic() - started < self.min_lifetime:
+                time.sleep(self.min_lifetime)
+
+            self.spawn()
+
+    def spawn(self):
+        master = os.getpid()
+        pid = os.fork()
+
+        if pid != 0:
+            self.children[pid] = time.monotonic()
+            return pid
+
+        status = 0
+        try:
+            self.run_worker(master)
+        except BaseException:
+            import traceback
+
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def handle_stop(self, signum, frame):
+        self.running = False
+        self.kill_workers(signal.SIGTERM)
+
+    def handle_reload(self, signum, frame):
+        # Workers exit once their current request is done and are replaced
+        # by the monitor loop
+        self.kill_workers(signal.SIGTERM)
+
+    def kill_workers(self, signum):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run_worker(self, master):
+        signal.signal(signal.SIGTERM, self.handle_worker_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        server = WorkerWSGIServer(
+            self.hostname,
+            self.port,
+            WorkerRequestHandler.application(self.app, self.sendfile),
+            handler=WorkerRequestHandler,
+            fd=self.socket.fileno(),
+        )
+
+        # Workers race to accept, losers get EAGAIN rather than blocking
+        server.socket.setblocking(False)
+        server.timeout = self.poll_interval
+
+        while self.alive:
+            server.handle_request()
+
+            # Don't outlive a master that was killed outright
+            if os.getppid() != master:
+                break
+
+            if self.max_requests is not None and server.requests >= self.max_requests:
+                break
+
+            if self.max_rss is not None and rss() > self.max_rss:
+                break
+
+        server.server_close()
+
+    def handle_worker_stop(self, signum, frame):
+        self.alive = False
@@ -1,21 +1,68 @@
+import os
+import hmac
+import json
+import time
+import zlib
+import base64
+import pickle
+import hashlib
+import sqlite3
+import atexit
+import tempfile
+import threading
+
+from werkzeug.local import LocalProxy
+from secure_cookie.session import Session, SessionStore
 from secure_cookie.session import FilesystemSessionStore as WerkzeugFilesystemSessionStore
 
+from .cache import LRUCache
+from .serialise import tojson
+
+# Optional, only needed for encrypted cookie sessions
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+
+class LazySession(object):
+    """Loads the session from its store the first time it is used"""
+
+    def __init__(self, store, sid):
+        self.store = store
+        self.sid = sid
+        self.session = None
+
+    def __call__(self):
+        if self.session is None:
+            self.store.clean()
+
+            if self.sid is None:
+                self.session = self.store.new()
+            else:
+                self.session = self.store.get(self.sid)
+
+        return self.session
+
 
 class SessionSignalMixin:
 
     def pre_response(self, request):
-        self.clean()
-        sid = request.cookies.get(self.COOKIE_NAME)
-
-        if sid is None:
-            request.session = self.new()
-        else:
-            request.session = self.get(sid)
+        # `request.session` is a proxy, the store is only touched if the view
+        # actually uses the session
+        request.session_loader = LazySession(self, request.cookies.get(self.COOKIE_NAME))
+        request.session = LocalProxy(request.session_loader)
 
     def post_response(self, request, response):
-        if request.session.should_save:
-            self.save(request.session)
-            response.set_cookie(self.COOKIE_NAME, request.session.sid)
+        session = request.session_loader.session
+
+        # Never loaded, so nothing could have changed
+        if session is None:
+            return
+
+        if session.should_save:
+            self.save(session)
+            response.set_cookie(self.COOKIE_NAME, session.sid)
 
 
 class FileSystemSessionStore(WerkzeugFilesystemSessionStore, SessionSignalMixin):
@@ -25,7 +72,464 @@ class FileSystemSessionStore(WerkzeugFilesystemSessionStore, SessionSignalMixin)
         self.expire = 40
 
         self.COOKIE_NAME = "sessionfast"
-        WerkzeugFilesystemSessionStore.__init__(self, session_class=None)
+        WerkzeugFilesystemSessionStore.__init__(self, session_class=session_class or Session)
+
+    def clean(self):
+        pass
+
+
+class MemorySessionStore(SessionStore, SessionSignalMixin):
+    """Keeps sessions in process memory
+
+    Sessions are held in an LRU of at most `maxsize` entries and expire
+    `expire` minutes after they were last used. Expired sessions are removed
+    by a background sweeper every `sweep_interval` seconds rather than on
+    the request path.
+
+    When `path` is given, changes are written behind by the same background
+    thread every `flush_interval` seconds (and at exit), and loaded again on
+    start up, so sessions survive restarts without a synchronous write per
+    request.
+
+    Note sessions are per process, with a prefork server each worker has
+    its own store. So workers don't overwrite each other, each process
+    writes its own `<path>.<pid>` file. On start up (in the master, before
+    workers are forked) every one of them is merged in to `path` and
+    removed.
+
+    Example usage
+    -------------
+
+    app = Simplerr('website', 'localhost', 8000,
+                   use_session_store=MemorySessionStore(path='/var/run/site.sessions'))
+    """
+
+    def __init__(self, session_class=None, maxsize=10000, path=None, flush_interval=5, sweep_interval=60):
+        SessionStore.__init__(self, session_class=session_class or Session)
+
+        # Number of minutes before sessions expire
+        self.expire = 40
+
+        self.COOKIE_NAME = "sessionfast"
+
+        self.sessions = LRUCache(maxsize=maxsize, ttl=self.expire * 60)
+
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.dirty = False
+
+        # Background sweeper and writer, started on first use in each process
+        self.worker = None
+        self.worker_pid = None
+        self.worker_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        if path is not None:
+            self.load()
+            atexit.register(self.flush)
 
     def clean(self):
+        # Expired sessions are removed by the background sweeper
         pass
+
+    def get(self, sid):
+        self.start_worker()
+
+        if not self.is_valid_key(sid):
+            return self.new()
+
+        data = self.sessions.get(sid)
+        if data is None:
+            return self.session_class({}, sid, False)
+
+        # Refresh the expiry, sessions expire after a period of inactivity
+        self.sessions.set(sid, data)
+
+        return self.session_class(dict(data), sid, False)
+
+    def save(self, session):
+        self.start_worker()
+
+        self.sessions.set(session.sid, dict(session))
+        self.dirty = True
+
+    def delete(self, session):
+        self.sessions.pop(session.sid)
+        self.dirty = True
+
+    def start_worker(self):
+        # Threads don't survive a fork, so check we own the running worker
+        if self.worker_pid == os.getpid():
+            return
+
+        with self.worker_lock:
+            if self.worker_pid == os.getpid():
+                return
+
+            self.worker = threading.Thread(target=self.run, name="simplerr-sessions", daemon=True)
+            self.worker.start()
+            self.worker_pid = os.getpid()
+
+    def run(self):
+        interval = self.sweep_interval
+        if self.path is not None:
+            interval = min(interval, self.flush_interval)
+
+        last_sweep = time.monotonic()
+
+        while not self.stopped.wait(interval):
+            if time.monotonic() - last_sweep >= self.sweep_interval:
+                if self.sessions.sweep():
+                    self.dirty = True
+                last_sweep = time.monotonic()
+
+            if self.path is not None and self.dirty:
+                self.flush()
+
+    def stop(self):
+        self.stopped.set()
+
+        if self.path is not None:
+            atexit.unregister(self.flush)
+            self.flush()
+
+    def flush(self):
+        """Write this process's live sessions to `<path>.<pid>`"""
+        if self.path is None:
+            return
+
+        self.dirty = False
+
+        # Expiry is stored as wall clock time so it holds across restarts
+        now = time.time()
+        sessions = [(sid, data, now + ttl) for sid, data, ttl in self.sessions.export()]
+
+        try:
+            self.write("{}.{}".format(self.path, os.getpid()), sessions)
+        except BaseException:
+            self.dirty = True
+            raise
+
+    def write(self, path, sessions):
+        folder = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(suffix=".__session", dir=folder)
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(sessions, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self):
+        """Load `path` and every process's file, merging them in to `path`"""
+        folder, name = os.path.split(os.path.abspath(self.path))
+
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+
+        # Files written by each process, see `flush()`
+        prefix = name + "."
+        files = [
+            os.path.join(folder, item) for item in names if item.startswith(prefix) and item[len(prefix) :].isdigit()
+        ]
+
+        now = time.time()
+        merged = {}
+
+        for path in [self.path] + files:
+            try:
+                with open(path, "rb") as f:
+                    sessions = pickle.load(f)
+            except Exception:
+                continue
+
+            # The same session may be in several files, keep the latest
+            for sid, data, expires in sessions:
+                if expires > now and expires > merged.get(sid, (None, 0))[1]:
+                    merged[sid] = (data, expires)
+
+        for sid, (data, expires) in merged.items():
+            self.sessions.set(sid, data, ttl=expires - now)
+
+        if files:
+            self.write(self.path, [(sid, data, expires) for sid, (data, expires) in merged.items()])
+
+            for path in files:
+                os.unlink(path)
+
+
+class SqliteSessionStore(SessionStore, SessionSignalMixin):
+    """Keeps sessions in a sqlite database
+
+    Unlike the filesystem store, which writes a file per session, lookups
+    are by primary key so they stay fast with any number of sessions. The
+    database runs in WAL mode so it can be shared by every worker process on
+    a host, with a connection per thread. Expired sessions are removed with a
+    single `DELETE` at most every `clean_interval` seconds.
+
+    Example usage
+    -------------
+
+    app = Simplerr('website', 'localhost', 8000, workers=4,
+                   use_session_store=SqliteSessionStore('/var/run/sessions.db'))
+    """
+
+    def __init__(self, path, session_class=None, clean_interval=60, timeout=5):
+        SessionStore.__init__(self, session_class=session_class or Session)
+
+        # Number of minutes before sessions expire
+        self.expire = 40
+
+        self.COOKIE_NAME = "sessionfast"
+
+        self.path = path
+        self.timeout = timeout
+        self.clean_interval = clean_interval
+        self.last_clean = 0
+        self.clean_lock = threading.Lock()
+
+        self.local = threading.local()
+
+        self.connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+            """
+        )
+
+    def connection(self):
+        # Connections can't be shared with a forked child, so they're keyed
+        # by process as well as thread
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+
+        return conn
+
+    def clean(self):
+        now = time.time()
+
+        if now - self.last_clean < self.clean_interval:
+            return
+
+        # Only one thread per process needs to clean up
+        if not self.clean_lock.acquire(blocking=False):
+            return
+
+        try:
+            self.last_clean = now
+            self.connection().execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+        finally:
+            self.clean_lock.release()
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+
+        now = time.time()
+        row = self.connection().execute(
+            "SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?", (sid, now)
+        ).fetchone()
+
+        if row is None:
+            return self.session_class({}, sid, False)
+
+        data, expires = row
+
+        # Sessions expire after a period of inactivity, the expiry is only
+        # pushed back once half of it has passed to save a write per request
+        lifetime = self.expire * 60
+        if expires - now < lifetime / 2:
+            self.connection().execute(
+                "UPDATE sessions SET expires = ? WHERE sid = ?", (now + lifetime, sid)
+            )
+
+        return self.session_class(pickle.loads(data), sid, False)
+
+    def save(self, session):
+        data = pickle.dumps(dict(session), pickle.HIGHEST_PROTOCOL)
+        expires = time.time() + self.expire * 60
+
+        self.connection().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (session.sid, data, expires),
+        )
+
+    def delete(self, session):
+        self.connection().execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+
+    def list(self):
+        rows = self.connection().execute("SELECT sid FROM sessions WHERE expires > ?", (time.time(),))
+        return [row[0] for row in rows]
+
+
+def b64decode(data):
+    # urlsafe base64 with the padding stripped
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class CookieSessionStore(SessionStore, SessionSignalMixin):
+    """Keeps sessions in the cookie itself
+
+    The session is serialised to JSON, compressed when that helps, and
+    signed with `secret_key` (or encrypted, with `encrypt=True` and the
+    cryptography package installed), so no state is kept on the server and
+    any worker can serve any request.
+
+    Sessions larger than `max_size` bytes once encoded are kept in the
+    `fallback` store instead, with only the session id in the cookie. Without
+    a fallback store saving an oversized session raises a ValueError.
+
+    Note a cookie session can't be revoked from the server, an old cookie is
+    valid until it expires.
+
+    Example usage
+    -------------
+
+    app = Simplerr('website', 'localhost', 8000,
+                   use_session_store=CookieSessionStore(SECRET_KEY, fallback=SqliteSessionStore('sessions.db')))
+    """
+
+    def __init__(self, secret_key, fallback=None, compress=True, encrypt=False, max_size=4000, session_class=None):
+        SessionStore.__init__(self, session_class=session_class or Session)
+
+        # Number of minutes before sessions expire
+        self.expire = 40
+
+        self.COOKIE_NAME = "sessionfast"
+
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode("utf-8")
+
+        # Separate keys for signing and encrypting
+        self.sign_key = hashlib.sha256(b"simplerr.session.sign" + secret_key).digest()
+        self.fernet = None
+
+        if encrypt:
+            if Fernet is None:
+                raise RuntimeError("Encrypted cookie sessions need the cryptography package")
+
+            key = hashlib.sha256(b"simplerr.session.encrypt" + secret_key).digest()
+            self.fernet = Fernet(base64.urlsafe_b64encode(key))
+
+        self.fallback = fallback
+        self.compress = compress
+        self.max_size = max_size
+
+    def clean(self):
+        if self.fallback is not None:
+            self.fallback.clean()
+
+    def new(self):
+        # Cookie sessions have no id, sessions with an id live in the fallback
+        return self.session_class({}, None, True)
+
+    def get(self, value):
+        kind, _, value = value.partition(".")
+
+        if kind == "s" and self.fallback is not None:
+            return self.fallback.get(value)
+
+        data = self.decode(kind, value)
+        if data is None:
+            return self.new()
+
+        return self.session_class(data, None, False)
+
+    def post_response(self, request, response):
+        session = request.session_loader.session
+
+        if session is None or not session.should_save:
+            return
+
+        if not session:
+            if session.sid is not None:
+                self.fallback.delete(session)
+
+            response.delete_cookie(self.COOKIE_NAME)
+            return
+
+        value = self.encode(dict(session))
+
+        if len(value) > self.max_size:
+            if self.fallback is None:
+                raise ValueError("Session of {} bytes is too large for a cookie".format(len(value)))
+
+            if session.sid is None:
+                session = self.fallback.session_class(dict(session), self.fallback.generate_key(), True)
+
+            self.fallback.save(session)
+            value = "s." + session.sid
+
+        elif session.sid is not None:
+            # Small enough to move back to the cookie
+            self.fallback.delete(session)
+
+        response.set_cookie(self.COOKIE_NAME, value, httponly=True)
+
+    def sign(self, body):
+        return hmac.new(self.sign_key, body, hashlib.sha256).digest()
+
+    def encode(self, data):
+        raw = tojson([int(time.time()), data]).encode("utf-8")
+        flag = b"-"
+
+        if self.compress and len(raw) > 128:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                raw, flag = packed, b"z"
+
+        raw = flag + raw
+
+        if self.fernet is not None:
+            return "e." + self.fernet.encrypt(raw).decode("ascii")
+
+        body = base64.urlsafe_b64encode(raw).rstrip(b"=")
+        sig = base64.urlsafe_b64encode(self.sign(body)).rstrip(b"=")
+
+        return "c.{}.{}".format(body.decode("ascii"), sig.decode("ascii"))
+
+    def decode(self, kind, value):
+        try:
+            if kind == "e" and self.fernet is not None:
+                raw = self.fernet.decrypt(value.encode("ascii"))
+
+            elif kind == "c" and self.fernet is None:
+                body, _, sig = value.encode("ascii").rpartition(b".")
+                if not hmac.compare_digest(self.sign(body), b64decode(sig)):
+                    return None
+                raw = b64decode(body)
+
+            else:
+                return None
+
+            if raw[:1] == b"z":
+                raw = zlib.decompress(raw[1:])
+            else:
+                raw = raw[1:]
+
+            issued, data = json.loads(raw)
+
+        except Exception:
+            # Tampered with, or written with another key
+            return None
+
+        if time.time() - issued > self.expire * 60:
+            return None
+
+        return data
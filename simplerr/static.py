@@ -0,0 +1,470 @@
+import os
+import mmap
+import stat
+import uuid
+import threading
+import urllib.parse
+import functools
+import mimetypes
+
+from datetime import datetime, timezone
+
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+from werkzeug.http import is_resource_modified, parse_range_header, parse_if_range_header
+
+from .cache import LRUCache
+from .compress import SUFFIXES, ENCODINGS, MIN_SIZE, is_compressible, negotiate, compress
+
+# Files up to this size are kept in memory once read, larger files are
+# memory mapped and sent in chunks of MMAP_CHUNK_SIZE
+HOT_MAX_SIZE = 256 * 1024
+MMAP_CHUNK_SIZE = 1024 * 1024
+
+# Recently sent files by path, see `StaticFile`. Small files are bounded by
+# the bytes held in memory. Each mapped file holds a file descriptor, so they
+# are bounded by count and their maps closed as they leave the cache.
+hot_files = LRUCache(maxsize=4096, maxbytes=64 * 1024 * 1024)
+mapped_files = LRUCache(maxsize=64, on_evict=lambda entry: entry.close())
+
+# Files without a precompressed copy, up to this size, are compressed on
+# the fly and the result kept in `variants`
+DYNAMIC_MAX_SIZE = 1024 * 1024
+
+# Compressed files by (path, etag, encoding), False when compressing
+# didn't help
+variants = LRUCache(maxbytes=32 * 1024 * 1024)
+
+
+class StaticFile(object):
+    """A file as last seen on disk, with its validators and either its
+    contents (small files) or a memory map of it (everything else)
+
+    Entries are only valid while the file's modified time and size match,
+    see `is_current()`. Files should be replaced rather than rewritten in
+    place, a mapped file truncated while it is being sent can crash the
+    worker.
+    """
+
+    def __init__(self, path, st):
+        self.path = path
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.etag, self.last_modified = validators(st)
+
+        self.content = None
+
+        # Mapped files, opened on first use. See `close()`
+        self.map = None
+        self.users = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+        if self.size <= HOT_MAX_SIZE:
+            with open(path, "rb") as f:
+                self.content = f.read()
+
+    def is_current(self, st):
+        return st.st_mtime_ns == self.mtime_ns and st.st_size == self.size
+
+    def read(self):
+        if self.content is not None:
+            return self.content
+
+        return b"".join(self.chunks(0, self.size))
+
+    def acquire(self):
+        """The map, held open until `release()`, or None once closed"""
+        with self.lock:
+            if self.map is None and not self.closed:
+                with open(self.path, "rb") as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            if self.map is not None:
+                self.users += 1
+
+            return self.map
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+
+            if self.closed and not self.users:
+                self.unmap()
+
+    def close(self):
+        """Close the map once every response using it is done"""
+        with self.lock:
+            self.closed = True
+
+            if not self.users:
+                self.unmap()
+
+    def unmap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def chunks(self, start, stop):
+        if self.content is not None:
+            yield self.content[start:stop]
+            return
+
+        mapping = self.acquire()
+
+        # Evicted before it was used, read the file instead
+        if mapping is None:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+
+                for offset in range(start, stop, MMAP_CHUNK_SIZE):
+                    yield f.read(min(MMAP_CHUNK_SIZE, stop - offset))
+            return
+
+        try:
+            # Slicing the map copies straight from the page cache, no reads
+            for offset in range(start, stop, MMAP_CHUNK_SIZE):
+                yield mapping[offset:min(offset + MMAP_CHUNK_SIZE, stop)]
+        finally:
+            self.release()
+
+
+class Offload(object):
+    """Hand file transfers to the front end web server
+
+    Rather than sending the file, `send_file()` responds with a header
+    telling the server in front of simplerr to send it, so no worker is held
+    for the transfer. Validators are still checked here, so 304s are
+    answered without involving the front end.
+
+    With nginx (`X-Accel-Redirect`) the header is `prefix` plus the file's
+    path relative to `root`, and `prefix` should be an `internal` location
+    aliased to `root`. With Apache or lighttpd (`X-Sendfile`) the header is
+    the file's absolute path. Files outside `root` are sent as normal.
+
+    Example usage
+    -------------
+
+    # location /_files/ { internal; alias /srv/site/; }
+    app = Simplerr('website', 'localhost', 8000, offload=Offload(root='/srv/site', prefix='/_files/'))
+
+    # With mod_xsendfile
+    app = Simplerr('website', 'localhost', 8000, offload=Offload('X-Sendfile', root='/srv/site'))
+    """
+
+    def __init__(self, header="X-Accel-Redirect", root="/", prefix="/"):
+        self.header = header
+        self.root = os.path.abspath(root)
+        self.prefix = prefix
+
+    def location(self, path):
+        """Value of the header for a path, None if it isn't under `root`"""
+        path = os.path.abspath(path)
+
+        if os.path.commonpath([self.root, path]) != self.root:
+            return None
+
+        if self.header.lower() == "x-accel-redirect":
+            relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+            return self.prefix.rstrip("/") + "/" + urllib.parse.quote(relative)
+
+        return path
+
+
+def get_file(path, st):
+    """Current `StaticFile` for a path, from `hot_files` or `mapped_files`
+    where possible"""
+    files = hot_files if st.st_size <= HOT_MAX_SIZE else mapped_files
+    entry = files.get(path)
+
+    if entry is None or not entry.is_current(st):
+        entry = StaticFile(path, st)
+        files.set(path, entry, size=entry.size)
+
+        # The file may have changed size, and moved between the two
+        (mapped_files if files is hot_files else hot_files).pop(path)
+
+    return entry
+
+
+def send_file(environ, path, mimetype=None, max_age=10800, compress=True, offload=None, immutable=False):
+    """Response for a file on disk, as used by `file=True` routes
+
+    Validators (`ETag` and `Last-Modified`) come from the file's stat data,
+    so conditional requests are answered with a 304 without opening the
+    file. Single and multiple byte `Range` requests get a 206 response.
+
+    With `compress` set, text files are sent compressed to clients that
+    accept it, using a `.br` or `.gz` copy next to the file when there is an
+    up to date one (see `simplerr precompress`), otherwise compressing it on
+    the fly. Range requests are always served from the uncompressed file.
+
+    Small files are served from memory. Larger files are sent with the
+    server's `wsgi.file_wrapper` when it has one (eg sendfile, see
+    `simplerr.server.SendfileWrapper`), otherwise from a memory map.
+
+    With `offload` set, see `Offload`, the front end server sends the file.
+    Files that never change, eg fingerprinted assets, can be marked
+    `immutable` so clients don't revalidate them.
+
+    Example usage
+    -------------
+
+    @web('/download/<name>')
+    def download(request, name):
+        return send_file(request.environ, '/srv/downloads/' + secure_filename(name))
+    """
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return Response(status=404)
+
+    if not stat.S_ISREG(st.st_mode):
+        return Response(status=404)
+
+    location = None if offload is None else offload.location(path)
+    if location is not None:
+        return offload_file(environ, path, st, mimetype, max_age, immutable, offload.header, location)
+
+    # Validators come from the stat data alone, the file is only read (see
+    # `get_file()`) once a body is sent
+    etag, last_modified = validators(st)
+    mimetype = "{};charset=utf-8".format(mimetype or guess_mimetype(path, environ))
+
+    vary = compress and is_compressible(mimetype)
+    encoding = encoded = None
+
+    if vary and "HTTP_RANGE" not in environ:
+        encoding, encoded = find_encoded(environ, path, st, etag)
+
+    # Each encoding is a separate representation with its own etag, decided
+    # without reading the file so a 304 never needs to
+    if encoding is not None:
+        etag = "{}-{}".format(etag, encoding)
+
+    if not is_resource_modified(environ, etag, last_modified=last_modified):
+        response = Response(status=304)
+        set_headers(response, etag, last_modified, max_age, vary, immutable)
+        return response
+
+    entry = get_file(path, st)
+
+    # No precompressed copy, compress it now
+    if encoding is not None and encoded is None:
+        encoded = compress_file(entry, encoding)
+
+        if encoded is None:
+            encoding = None
+            etag = entry.etag
+
+    ranges = None if encoding is not None else parse_ranges(environ, st.st_size, etag, last_modified)
+
+    if encoding is not None:
+        if isinstance(encoded, bytes):
+            response = Response(encoded)
+        else:
+            response = Response(wrap_file(environ, open(encoded, "rb")), direct_passthrough=True)
+            response.content_length = os.stat(encoded).st_size
+
+        response.headers["Content-Type"] = mimetype
+        response.headers["Content-Encoding"] = encoding
+
+    elif ranges is None:
+        if entry.content is not None:
+            response = Response(entry.content, direct_passthrough=True)
+        elif "wsgi.file_wrapper" in environ:
+            response = Response(wrap_file(environ, open(path, "rb")), direct_passthrough=True)
+        else:
+            response = Response(entry.chunks(0, entry.size), direct_passthrough=True)
+
+        response.headers["Content-Type"] = mimetype
+        response.content_length = st.st_size
+
+    elif not ranges:
+        response = Response(status=416)
+        response.headers["Content-Range"] = "bytes */{}".format(st.st_size)
+
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+
+        response = Response(entry.chunks(start, stop), status=206, direct_passthrough=True)
+        response.headers["Content-Type"] = mimetype
+        response.headers["Content-Range"] = "bytes {}-{}/{}".format(start, stop - 1, st.st_size)
+        response.content_length = stop - start
+
+    else:
+        response = multipart_ranges(entry, ranges, mimetype)
+
+    response.headers["Accept-Ranges"] = "bytes"
+    set_headers(response, etag, last_modified, max_age, vary, immutable)
+
+    return response
+
+
+def offload_file(environ, path, st, mimetype, max_age, immutable, header, location):
+    etag, last_modified = validators(st)
+    mimetype = "{};charset=utf-8".format(mimetype or guess_mimetype(path, environ))
+
+    if not is_resource_modified(environ, etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        response = Response()
+        response.headers["Content-Type"] = mimetype
+        response.headers[header] = location
+
+    set_headers(response, etag, last_modified, max_age, immutable=immutable)
+
+    return response
+
+
+def set_headers(response, etag, last_modified, max_age, vary=False, immutable=False):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = "public, max-age={}".format(max_age)
+
+    if immutable:
+        response.headers["Cache-Control"] += ", immutable"
+
+    if vary:
+        response.vary.add("Accept-Encoding")
+
+
+def find_encoded(environ, path, st, etag):
+    """(encoding, path) of the best compressed copy of a file the client
+    accepts, path is None when it should be compressed on the fly (see
+    `compress_file()`). (None, None) to send the file as is"""
+    if negotiate(environ) is None:
+        return None, None
+
+    # Precompressed copies, ignoring any older than the file
+    available = {}
+
+    for encoding, suffix in SUFFIXES.items():
+        try:
+            if os.stat(path + suffix).st_mtime_ns >= st.st_mtime_ns:
+                available[encoding] = path + suffix
+        except FileNotFoundError:
+            pass
+
+    encoding = negotiate(environ, list(available))
+    if encoding is not None:
+        return encoding, available[encoding]
+
+    if not MIN_SIZE <= st.st_size <= DYNAMIC_MAX_SIZE:
+        return None, None
+
+    encoding = negotiate(environ, ENCODINGS)
+    if encoding is None:
+        return None, None
+
+    # Already found not to compress
+    if variants.get((path, etag, encoding), count=False) is False:
+        return None, None
+
+    return encoding, None
+
+
+def compress_file(entry, encoding):
+    """Compressed contents of a file, cached in `variants`. None when
+    compressing doesn't make it smaller"""
+    key = (entry.path, entry.etag, encoding)
+    data = variants.get(key)
+
+    if data is None:
+        raw = entry.read()
+
+        # Compressed once and then cached, so favour size over speed
+        data = compress(raw, encoding, 9)
+        if len(data) >= len(raw):
+            data = False
+
+        variants.set(key, data, size=len(data or b""))
+
+    return data or None
+
+
+def validators(st):
+    """(etag, last modified) for a file's stat result"""
+    etag = "{:x}-{:x}".format(st.st_mtime_ns, st.st_size)
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+
+    return etag, last_modified
+
+
+def guess_mimetype(path, environ):
+    mimetype = guess_type(os.path.basename(path))
+
+    # Sometimes files are named without extensions in the local storage, so
+    # instead try and infer from the route
+    if mimetype is None:
+        urifile = environ.get("PATH_INFO").split("/")[-1:][0]
+        mimetype = guess_type(urifile)
+
+    return mimetype
+
+
+@functools.lru_cache(maxsize=4096)
+def guess_type(name):
+    # Only the extension matters, so this is cached by file name
+    return mimetypes.guess_type(name)[0]
+
+
+def parse_ranges(environ, size, etag, last_modified):
+    """Satisfiable byte ranges as [(start, stop)], `None` for the whole file
+
+    An empty list means a range was asked for but none of it is in the file.
+    """
+    header = parse_range_header(environ.get("HTTP_RANGE"))
+
+    if header is None or header.units != "bytes":
+        return None
+
+    # Only send part of the file if it hasn't changed since the client got
+    # the rest of it
+    if_range = parse_if_range_header(environ.get("HTTP_IF_RANGE"))
+
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+
+    if if_range.date is not None and if_range.date != last_modified:
+        return None
+
+    ranges = []
+
+    for start, stop in header.ranges:
+        # Suffix range, eg the last 500 bytes
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+
+        if start < stop:
+            ranges.append((start, stop))
+
+    return ranges
+
+
+def multipart_ranges(entry, ranges, mimetype):
+    boundary = uuid.uuid4().hex
+
+    parts = []
+    for start, stop in ranges:
+        head = "\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n".format(
+            boundary, mimetype, start, stop - 1, entry.size
+        )
+        parts.append((head.encode("latin1"), start, stop))
+
+    tail = "\r\n--{}--\r\n".format(boundary).encode("latin1")
+
+    def body():
+        for head, start, stop in parts:
+            yield head
+            yield from entry.chunks(start, stop)
+
+        yield tail
+
+    response = Response(body(), status=206, direct_passthrough=True)
+    response.headers["Content-Type"] = "multipart/byteranges; boundary={}".format(boundary)
+    response.content_length = sum(len(head) + stop - start for head, start, stop in parts) + len(tail)
+
+    return response
@@ -1,16 +1,44 @@
-from jinja2 import Environment, FileSystemLoader
+import os
+import json
+import time
+import hashlib
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, TemplateError
+from jinja2.defaults import DEFAULT_FILTERS, DEFAULT_NAMESPACE
+
+from .cache import LRUCache
+from .serialise import strict_serial
+
+# Files picked up by `Template.precompile()`
+TEMPLATE_EXTENSIONS = ("html", "htm", "xml", "txt", "jinja", "jinja2", "j2")
 
 
 class Template(object):
     # TODO: This should be attached at the wsgi app level
     # TODO: Updates this to add filters, eg filters['escapejs'] = json.dumps
-    filters = {}
-    globals = {}
+    #
+    # Shared with every environment (and `web.filters`), so filters
+    # registered at any time are used without copying them per render
+    filters = dict(DEFAULT_FILTERS)
+    globals = dict(DEFAULT_NAMESPACE)
 
-    def __init__(self, cwd):
+    # Folder to keep compiled templates in between restarts, None to
+    # compile in memory only
+    cache_dir = None
+
+    def __init__(self, cwd, cache_dir=None):
         self.cwd = cwd
+        self.cache_dir = cache_dir or Template.cache_dir
+
+        bytecode_cache = None
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(self.cache_dir)
+
+        # Templates are a fixed set of files, keep every compiled template
+        # rather than jinja's default of the 400 most recent
         self.env = Environment(
-            loader=FileSystemLoader(cwd), autoescape=True
+            loader=FileSystemLoader(cwd), autoescape=True, bytecode_cache=bytecode_cache, cache_size=-1
         )
 
         self.env.filters = Template.filters
@@ -18,3 +46,117 @@ class Template(object):
 
     def render(self, template, data={}):
         return self.env.get_template(template).render(**data)
+
+    def stream(self, template, data={}, buffer_size=5):
+        """Render lazily, yielding the output in chunks of `buffer_size`
+        template pieces"""
+        stream = self.env.get_template(template).stream(**data)
+
+        if buffer_size > 1:
+            stream.enable_buffering(buffer_size)
+
+        return stream
+
+    def precompile(self, extensions=TEMPLATE_EXTENSIONS):
+        """Compile every template under cwd
+
+        Compiled templates are kept by the environment and, when `cache_dir`
+        is set, written to the bytecode cache so other workers and later
+        restarts skip compiling them. Filters used by the templates should be
+        registered first, eg by preloading the view scripts.
+
+        Returns {"templates": count, "errors": [(name, error)], "seconds": ...}
+        """
+        start = time.perf_counter()
+
+        names = self.env.list_templates(extensions=extensions)
+        errors = []
+
+        for name in names:
+            try:
+                self.env.get_template(name)
+            except TemplateError as e:
+                errors.append((name, e))
+
+        return {
+            "templates": len(names) - len(errors),
+            "errors": errors,
+            "seconds": time.perf_counter() - start,
+        }
+
+
+class RenderCache(object):
+    """Cache of rendered templates
+
+    Entries are keyed by the template and a hash of the context it was
+    rendered with. The `request` is left out of the context, request
+    attributes the output depends on are named in `vary`, eg `('args',)`.
+    Contexts holding values without a registered serialiser (see
+    `simplerr.serialise.register()`) are never cached, as they can't be
+    told apart reliably.
+
+    An entry is only used while the compiled template it was rendered from
+    is current, so editing a template invalidates its entries. Templates it
+    extends or includes are not checked.
+
+    Example usage
+    -------------
+
+    # Used by routes declared with render_cache=True
+    @web('/prices', 'prices.html', render_cache=True, render_vary=('args',))
+    def prices(request):
+        return {'prices': get_prices()}
+
+    # Bounds can be changed by replacing the cache
+    web.render_cache = RenderCache(maxbytes=64 * 1024 * 1024, ttl=300)
+    """
+
+    def __init__(self, maxsize=1000, maxbytes=None, ttl=60):
+        self.entries = LRUCache(maxsize=maxsize, maxbytes=maxbytes, ttl=ttl)
+
+    def render(self, engine, template, data={}, vary=()):
+        compiled = engine.env.get_template(template)
+
+        key = self.key(template, data, vary)
+        if key is None:
+            return compiled.render(**data)
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is compiled:
+            return entry[1]
+
+        out = compiled.render(**data)
+        self.entries.set(key, (compiled, out), size=len(out))
+
+        return out
+
+    def key(self, template, data, vary=()):
+        context = {name: value for name, value in data.items() if name != "request"}
+
+        request = data.get("request")
+        varies = [self.vary_value(request, name) for name in vary]
+
+        try:
+            fingerprint = json.dumps([template, context, varies], sort_keys=True, default=strict_serial)
+        except (TypeError, ValueError):
+            return None
+
+        return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def vary_value(request, name):
+        value = getattr(request, name, None)
+
+        # MultiDicts (args, form, cookies) and headers
+        if hasattr(value, "to_dict"):
+            value = value.to_dict(flat=False)
+        elif hasattr(value, "items"):
+            value = list(value.items())
+
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return self.entries.stats()
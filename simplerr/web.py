@@ -1,27 +1,64 @@
 #!/usr/bin/env python
 
-import mimetypes
+import copy
+import zlib
 import functools
+import contextvars
 
 from pathlib import Path
 
 from werkzeug.wrappers import Response
-from werkzeug.wsgi import wrap_file
-from werkzeug.exceptions import abort
-from werkzeug.routing import Map, Rule, MethodNotAllowed
+from werkzeug.exceptions import abort, MethodNotAllowed
+from werkzeug.routing import Map, Rule
 from werkzeug.utils import redirect as wz_redirect
 
-from .template import Template
+from .template import Template, RenderCache
+from .static import send_file
+from . import assets
+from .cache import ResponseCache
 from .methods import BaseMethod
 from .serialise import tojson
 from .errors import TooManyArgumentsError
-from .peewee import is_model, is_model_select, model_to_dict
+from .peewee import is_model, is_model_select, model_to_dict, models_to_dicts
 
 
 def make_response(*args, **kwargs):
     return Response(*args, **kwargs)
 
 
+class RouteMap(object):
+    """Compiled `werkzeug.routing.Map()` for a list of `web()` destinations
+
+    Building the rules compiles a regex per route, so a map is built once per
+    view script and reused, leaving only `bind_to_environ()` per request.
+    """
+
+    def __init__(self, destinations):
+        self.destinations = destinations
+        self.map = Map()
+        self.index = {}
+
+        for item in destinations:
+            # Lets create an index on routes, as urls.match returns a route
+            self.index[item.endpoint] = item
+
+            # Create the rule and add it tot he map
+            rule = Rule(item.route, endpoint=item.endpoint, methods=item.methods)
+            self.map.add(rule)
+
+    def match(self, environ):
+        # Check for match
+        urls = self.map.bind_to_environ(environ)
+        endpoint, args = urls.match()
+
+        # Get match and attach current args, the copy keeps the args private
+        # to this request as the destinations are shared between threads
+        match = copy.copy(self.index[endpoint])
+        match.args = args
+
+        return match
+
+
 class web(object):
     """Primary routing decorator and helpers
 
@@ -99,6 +136,33 @@ class web(object):
         Otherwise sepcify `'GET'`, `'POST'`, `'PUT'`, `'DELETE'`. Note that
         `'HEAD'` is accepeted on `'GET'` requests.
 
+    stream
+        When `True` a returned peewee `ModelSelect` is sent as a chunked JSON
+        response, rows are read and encoded lazily so memory stays flat
+        regardless of the number of rows. For templated routes the page is
+        rendered and sent a piece at a time rather than built in memory.
+
+    stream_buffer
+        Number of template pieces to collect before sending a chunk when
+        streaming a template, defaults to 5.
+
+    render_cache
+        When `True` rendered templates are kept in `web.render_cache` and
+        reused for the same template and context, see `RenderCache`.
+
+    render_vary
+        Names of `request` attributes the rendered template depends on, eg
+        `('args', 'cookies')`, added to the render cache key.
+
+    cache
+        A `simplerr.cache.Cache`, responses are then kept in `web.cache` and
+        sent again without calling the view.
+
+    etag
+        When `True` JSON and template responses get a weak `ETag` made from
+        a hash of the body, and a request sending it back in `If-None-Match`
+        gets a 304 with no body. Defaults to `None`, which follows `web.etag`.
+
 
     Footnotes
     =========
@@ -108,16 +172,50 @@ class web(object):
     """
 
     destinations = []
+    route_map = None
+
+    # Destinations registered while a view script is being loaded, scoped to
+    # the loading context so concurrent loads can't see each other's routes.
+    # See `script.get_entry()`, falls back to `destinations` when not set.
+    loading = contextvars.ContextVar("loading", default=None)
 
-    filters = {}
+    # The same dict as the template engine's filters, see `web.filter()`
+    filters = Template.filters
     template_engine = None
 
+    # Rendered templates, for routes declared with `render_cache=True`
+    render_cache = RenderCache()
+
+    # Hand file routes to the front end server, see `simplerr.static.Offload`
+    offload = None
+
+    # Responses for routes declared with `cache=Cache(...)`. NOTE: Routes keep
+    # their own `Cache` settings as `self.cache`, the store is only on the class
+    cache = ResponseCache()
+
+    # Default for routes that don't set `etag`, see `Simplerr(use_etags=True)`
+    etag = False
+
     @staticmethod
     def restore_presets():
         web.destinations = []
 
     def __init__(
-        self, *args, route=None, template=None, methods=None, endpoint=None, file=False, cors=None, mimetype=None
+        self,
+        *args,
+        route=None,
+        template=None,
+        methods=None,
+        endpoint=None,
+        file=False,
+        cors=None,
+        mimetype=None,
+        stream=False,
+        stream_buffer=5,
+        render_cache=False,
+        render_vary=(),
+        cache=None,
+        etag=None
     ):
         self.endpoint = endpoint
         self.fn = None
@@ -125,6 +223,12 @@ class web(object):
         self.file = file
         self.cors = cors
         self.mimetype = mimetype
+        self.stream = stream
+        self.stream_buffer = stream_buffer
+        self.render_cache = render_cache
+        self.render_vary = render_vary
+        self.cache = cache
+        self.etag = etag
 
         # We can specify route, template and methods using **kwargs
         self.route = route
@@ -190,7 +294,11 @@ class web(object):
         self.fn = fn
 
         # add this function into destinations
-        web.destinations.append(self)
+        destinations = web.loading.get()
+        if destinations is None:
+            destinations = web.destinations
+
+        destinations.append(self)
 
         @functools.wraps(fn)
         def decorated(request, *args, **kwargs):
@@ -201,40 +309,45 @@ class web(object):
         return decorated
 
     @staticmethod
-    def match(environ):
-        map = Map()
-        index = {}
-
-        for item in web.destinations:
-            # Lets create an index on routes, as urls.match returns a route
-            index[item.endpoint] = item
+    def match(environ, routes=None):
+        # Reuse the compiled map for the current destinations where possible,
+        # building werkzeug rules is the expensive part of matching
+        if routes is None:
+            if web.route_map is None or web.route_map.destinations != web.destinations:
+                web.route_map = RouteMap(list(web.destinations))
 
-            # Create the rule and add it tot he map
-            rule = Rule(item.route, endpoint=item.endpoint, methods=item.methods)
-            map.add(rule)
+            routes = web.route_map
 
-        # Check for match
-        urls = map.bind_to_environ(environ)
-        endpoint, args = urls.match()
-
-        # Get match and attach current args
-        match = index[endpoint]
-        match.args = args
-
-        return match
+        return routes.match(environ)
 
     @staticmethod
-    def process(request, environ, cwd):
+    def process(request, environ, cwd, routes=None):
         # Weg web() object that matches this request
         try:
-            match = web.match(environ)
+            match = web.match(environ, routes)
         except MethodNotAllowed:
             return Response(status=405)
 
+        if match.cache is not None:
+            response = web.cache.respond(match.cache, match, request, lambda: web.call(match, request, environ, cwd))
+        else:
+            response = web.call(match, request, environ, cwd)
+
+        # After the cache, so cached responses are checked against the request too
+        return web.conditional(match, request, response)
+
+    @staticmethod
+    def call(match, request, environ, cwd):
         # Lets extract some key response information
         args = match.args
         val = match.fn(request, **args)
 
+        return web.respond(match, val, request, environ, cwd)
+
+    @staticmethod
+    def respond(match, val, request, environ, cwd):
+        """Build the response for the value returned by a matched view"""
+
         # Get optional status code for json response
         # allows for routes to return as:
         #   >>> return { 'error': 'No token.' }, 401
@@ -264,27 +377,36 @@ class web(object):
 
             data = out
 
+        # Stream peewee model selects row by row rather than building the
+        # whole result in memory first
+        if is_model_select(data) and match.stream is True and template is None:
+            response = Response(web.stream_results(data), status=status_code)
+            response.headers["Content-Type"] = "application/json"
+
+            if cors:
+                cors.set(response)
+
+            return response
+
         # Check to see if this is a peewee model select and convert models to dict
         if is_model_select(data):
-            array_out = []
-            for item in data:
-                if "to_dict" in dir(out):
-                    array_out.append(item.to_dict())
-                else:
-                    array_out.append(model_to_dict(item))
-
-                out = {"results": array_out}
-                data = out
+            out = {"results": web.select_to_dicts(data)}
+            data = out
 
         # Template expected, attempt render
         if template is not None:
             # Add request to data
             data = data or {}
             data["request"] = request
-            out = web.template(cwd, template, data)
+
+            if match.stream is True:
+                out = web.stream_template(cwd, template, data, match.stream_buffer)
+            else:
+                out = web.template(cwd, template, data, match.render_cache, match.render_vary)
 
             response = Response(out)
             response.headers["Content-Type"] = "text/html;charset=utf-8"
+            web.add_etag(match, response)
 
             if cors:
                 cors.set(response)
@@ -296,24 +418,15 @@ class web(object):
         if is_file is True:
             file_path = Path(cwd) / Path(out)
 
-            try:
-                file_ = open(file_path.absolute().__str__(), "rb")
-            except FileNotFoundError:  # endpoint doesn't exist
-                return Response(status=404)
-
-            data = wrap_file(environ, file_)
-
-            mtype = mimetype or mimetypes.guess_type(file_path.__str__())[0]
-
-            # Sometimes files are named without extensions in the local storage, so
-            # instead try and infer from the route
-            if mtype is None:
-                urifile = environ.get("PATH_INFO").split("/")[-1:][0]
-                mtype = mimetypes.guess_type(urifile)[0]
+            path = file_path.absolute().__str__()
 
-            response = Response(data, direct_passthrough=True)
-            response.headers["Content-Type"] = "{};charset=utf-8".format(mtype)
-            response.headers["Cache-Control"] = "public, max-age=10800"
+            # Fingerprinted bundles never change, see `web.js()`
+            if assets.is_asset(path):
+                response = send_file(
+                    environ, path, mimetype, assets.ASSET_MAX_AGE, offload=web.offload, immutable=True
+                )
+            else:
+                response = send_file(environ, path, mimetype, offload=web.offload)
 
             if cors:
                 cors.set(response)
@@ -324,6 +437,7 @@ class web(object):
         if isinstance(data, str):
             response = Response(data)
             response.headers["Content-Type"] = "text/html;charset=utf-8"
+            web.add_etag(match, response)
 
             if cors:
                 cors.set(response)
@@ -335,12 +449,78 @@ class web(object):
         out = tojson(data)
         response = Response(out, status=status_code)
         response.headers["Content-Type"] = "application/json"
+        web.add_etag(match, response)
 
         if cors:
             cors.set(response)
 
         return response
 
+    @staticmethod
+    def uses_etag(match):
+        return web.etag if match.etag is None else match.etag
+
+    @staticmethod
+    def add_etag(match, response):
+        """Set a weak `ETag` from a crc32 of the body, for routes using etags
+
+        Streamed bodies aren't tagged, they would have to be held in memory
+        to be hashed.
+        """
+        if not web.uses_etag(match) or response.status_code != 200 or not response.is_sequence:
+            return
+
+        data = response.get_data()
+        response.set_etag("{:08x}-{:x}".format(zlib.crc32(data), len(data)), weak=True)
+
+    @staticmethod
+    def conditional(match, request, response):
+        """Turn the response in to a 304 when the client already has it,
+        for routes using etags"""
+        if not web.uses_etag(match) or response.direct_passthrough or response.status_code != 200:
+            return response
+
+        if "ETag" in response.headers and request.if_none_match:
+            response.make_conditional(request)
+
+        return response
+
+    @staticmethod
+    def stream_results(query, chunk_size=100):
+        """Encode a peewee select as `{"results": [...]}`, a chunk at a time
+
+        Rows are read lazily using `query.iterator()` so neither the models
+        nor the encoded JSON for the whole select are held in memory.
+        """
+        yield '{"results": ['
+
+        separator = ""
+        rows = []
+
+        for item in query.iterator():
+            rows.append(item)
+
+            if len(rows) >= chunk_size:
+                yield separator + ", ".join(tojson(row) for row in web.select_to_dicts(rows))
+                separator = ", "
+                rows = []
+
+        if rows:
+            yield separator + ", ".join(tojson(row) for row in web.select_to_dicts(rows))
+
+        yield "]}"
+
+    @staticmethod
+    def select_to_dicts(rows):
+        # Models may provide their own to_dict(), otherwise related rows are
+        # batch loaded for the whole list
+        rows = list(rows)
+
+        if rows and hasattr(rows[0], "to_dict"):
+            return [item.to_dict() for item in rows]
+
+        return models_to_dicts(rows)
+
     @staticmethod
     def response(data, *args, **kwargs):
         # TODO: This should build a web() compliant response object
@@ -370,17 +550,45 @@ class web(object):
         return decorated
 
     @staticmethod
-    def template(cwd, template, data):
+    def js(name, source_dir="/", output_dir=None, minify=True):
+        """Bundle the javascript files yielded by the decorated function in to
+        one fingerprinted file, its url is available to templates as
+        `assets.<name>`, see `simplerr.assets.Bundle`
+
+        Example usage
+        -------------
+
+        @web.js('app_js', source_dir='/static/js')
+        def app_js():
+            yield 'app.controller.js'
+            yield 'app.service.js'
+        """
+        return assets.bundle(name, "js", source_dir, output_dir, minify)
+
+    @staticmethod
+    def css(name, source_dir="/", output_dir=None, minify=True):
+        """Same as `web.js()` for stylesheets"""
+        return assets.bundle(name, "css", source_dir, output_dir, minify)
+
+    @staticmethod
+    def template(cwd, template, data, cache=False, vary=()):
         # This may have to be removed if CWD proves to be mutable per request
+        # NOTE: Filters are shared with the template engine, see `web.filters`
         web.template_engine = web.template_engine or Template(cwd)
 
-        # Add any registered filters
-        for filter in web.filters.keys():
-            web.template_engine.env.filters[filter] = web.filters[filter]
+        if cache is True:
+            return web.render_cache.render(web.template_engine, template, data, vary)
 
         # Return Rendering
         return web.template_engine.render(template, data)
 
+    @staticmethod
+    def stream_template(cwd, template, data, buffer_size=5):
+        # Same as `web.template()` but yields the page a chunk at a time
+        web.template_engine = web.template_engine or Template(cwd)
+
+        return web.template_engine.stream(template, data, buffer_size)
+
     @staticmethod
     def redirect(location, code=302, Response=None):
         return wz_redirect(location, code, Response)
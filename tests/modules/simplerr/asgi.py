@@ -0,0 +1,64 @@
+# Imports {{{1
+import os
+import json
+import asyncio
+
+from unittest import TestCase
+from simplerr.asgi import asgi_dispatcher
+from simplerr.dispatcher import dispatcher, WebEvents
+
+
+def request(app, path, method='GET'):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'localhost')],
+    }
+
+    asyncio.run(app(scope, receive, send))
+
+    status = messages[0]['status']
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+
+    return status, body
+
+
+# Basic ASGI  {{{1
+class BasicASGITests(TestCase):
+
+    def setUp(self):
+        cwd = os.path.dirname(__file__)
+        self.app = asgi_dispatcher(dispatcher(cwd, WebEvents()))
+
+    def tearDown(self):
+        pass
+
+    def test_sync_view(self):
+        status, body = request(self.app, '/assets/scripts/sc_async/sync')
+        self.assertEqual(200, status)
+        self.assertEqual({'view': 'sync'}, json.loads(body))
+
+    def test_async_view(self):
+        status, body = request(self.app, '/assets/scripts/sc_async/async/hi')
+        self.assertEqual(200, status)
+        self.assertEqual({'view': 'async', 'msg': 'hi'}, json.loads(body))
+
+    def test_streaming_view(self):
+        status, body = request(self.app, '/assets/scripts/sc_async/stream')
+        self.assertEqual(200, status)
+        self.assertEqual(b'Hello World', body)
+
+    def test_head_request(self):
+        status, body = request(self.app, '/assets/scripts/sc_async/sync', method='HEAD')
+        self.assertEqual(200, status)
+        self.assertEqual(b'', body)
@@ -0,0 +1,20 @@
+from simplerr.web import web
+
+
+@web('/assets/scripts/sc_async/sync')
+def sync_view(request):
+    return {'view': 'sync'}
+
+
+@web('/assets/scripts/sc_async/async/<msg>')
+async def async_view(request, msg):
+    return {'view': 'async', 'msg': msg}
+
+
+@web('/assets/scripts/sc_async/stream')
+async def stream_view(request):
+    async def chunks():
+        for chunk in ('Hello', ' ', 'World'):
+            yield chunk
+
+    return chunks()
@@ -0,0 +1,91 @@
+# Imports {{{1
+import os
+import tempfile
+
+from unittest import TestCase
+from werkzeug.test import EnvironBuilder
+
+from simplerr import assets
+from simplerr.assets import Bundle, minify_css
+from simplerr.template import Template
+from simplerr.static import send_file
+from simplerr.web import web
+
+
+# Bundles  {{{1
+class BundleTests(TestCase):
+
+    def setUp(self):
+        self.site = tempfile.TemporaryDirectory()
+        self.root = Bundle.root
+        Bundle.root = self.site.name
+
+        os.makedirs(os.path.join(self.site.name, 'static'))
+
+        for name, body in [('a.js', 'var a = 1'), ('b.js', 'var b = 2;'), ('a.css', 'p {\n  color: red;\n}\n')]:
+            self.write(name, body)
+
+    def tearDown(self):
+        Bundle.root = self.root
+        self.site.cleanup()
+
+        for name in ('test_js', 'test_css'):
+            assets.bundles.pop(name, None)
+            assets.urls.pop(name, None)
+
+    def write(self, name, body):
+        with open(os.path.join(self.site.name, 'static', name), 'w') as f:
+            f.write(body)
+
+    def declare(self):
+        @web.js('test_js', source_dir='/static', output_dir='/static/dist')
+        def test_js():
+            yield 'a.js'
+            yield 'b.js'
+
+        return assets.bundles['test_js']
+
+    def test_build(self):
+        bundle = self.declare()
+
+        self.assertRegex(bundle.url, r'^/static/dist/test_js\.[0-9a-f]{8}\.js$')
+        self.assertTrue(os.path.exists(bundle.path))
+        self.assertTrue(assets.is_asset(bundle.path))
+
+        with open(bundle.path) as f:
+            self.assertEqual('var a = 1\n;\nvar b = 2;', f.read())
+
+    def test_template_global(self):
+        bundle = self.declare()
+
+        rendered = Template(self.site.name).env.from_string('{{ assets.test_js }}').render()
+        self.assertEqual(bundle.url, rendered)
+
+    def test_fingerprint_changes(self):
+        first = self.declare()
+        self.assertEqual(first.url, self.declare().url)
+
+        self.write('b.js', 'var b = 3;')
+        second = self.declare()
+
+        self.assertNotEqual(first.url, second.url)
+        self.assertFalse(assets.is_asset(first.path))
+        self.assertTrue(assets.is_asset(second.path))
+
+    def test_css(self):
+        @web.css('test_css', source_dir='/static')
+        def test_css():
+            yield 'a.css'
+
+        with open(assets.bundles['test_css'].path) as f:
+            self.assertEqual('p{color:red}', f.read())
+
+    def test_minify_css(self):
+        self.assertEqual('a :hover{margin:0 auto}', minify_css('/* x */ a :hover {\n margin: 0 auto;\n}'))
+
+    def test_immutable(self):
+        bundle = self.declare()
+        environ = EnvironBuilder(path=bundle.url).get_environ()
+
+        resp = send_file(environ, bundle.path, max_age=assets.ASSET_MAX_AGE, immutable=True)
+        self.assertEqual('public, max-age=31536000, immutable', resp.headers['Cache-Control'])
@@ -0,0 +1,138 @@
+# Imports {{{1
+import json
+import time
+
+from unittest import TestCase
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+from simplerr.cache import LRUCache, Cache
+from simplerr.web import web
+
+
+calls = []
+
+
+@web('/cached/prices', cache=Cache(ttl=60, vary=['args.region']))
+def cached_prices_fn(r):
+    calls.append('prices')
+    return {'region': r.args.get('region'), 'call': len(calls)}
+
+
+@web('/cached/stale', cache=Cache(ttl=0, stale=60))
+def cached_stale_fn(r):
+    calls.append('stale')
+    return {'call': len(calls)}
+
+
+@web('/cached/cookie', cache=Cache(ttl=60))
+def cached_cookie_fn(r):
+    calls.append('cookie')
+    response = Response('cookie')
+    response.set_cookie('a', 'b')
+    return response
+
+
+def get(path, method='GET'):
+    environ = EnvironBuilder(path=path, method=method).get_environ()
+    return web.process(Request(environ), environ, '.')
+
+
+# LRU Cache  {{{1
+class LRUCacheTests(TestCase):
+
+    def test_maxsize(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(['a', 'c'], cache.keys())
+
+    def test_maxbytes(self):
+        cache = LRUCache(maxbytes=10)
+        cache.set('a', 'a', size=6)
+        cache.set('b', 'b', size=6)
+
+        self.assertEqual(['b'], cache.keys())
+        self.assertEqual(6, cache.bytes)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('a'))
+
+    def test_on_evict(self):
+        evicted = []
+        cache = LRUCache(maxsize=1, on_evict=evicted.append)
+        cache.set('a', 1)
+        cache.set('a', 2)
+        cache.set('b', 3)
+        cache.clear()
+
+        self.assertEqual([1, 2, 3], evicted)
+
+
+# Response Cache  {{{1
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        web.cache.clear()
+        del calls[:]
+
+    def test_cached(self):
+        first = get('/cached/prices?region=au&ignored=1')
+        second = get('/cached/prices?region=au&ignored=2')
+
+        self.assertEqual(first.get_data(), second.get_data())
+        self.assertEqual(['prices'], calls)
+        self.assertIn('Age', second.headers)
+
+    def test_vary(self):
+        get('/cached/prices?region=au')
+        resp = get('/cached/prices?region=nz')
+
+        self.assertEqual('nz', json.loads(resp.get_data())['region'])
+        self.assertEqual(2, len(calls))
+
+    def test_post_not_cached(self):
+        get('/cached/prices', 'POST')
+        get('/cached/prices', 'POST')
+
+        self.assertEqual(2, len(calls))
+
+    def test_set_cookie_not_cached(self):
+        get('/cached/cookie')
+        get('/cached/cookie')
+
+        self.assertEqual(2, len(calls))
+
+    def test_invalidate(self):
+        get('/cached/prices?region=au')
+        get('/cached/stale')
+
+        web.cache.invalidate(route='/cached/prices')
+        self.assertEqual(1, len(web.cache.entries))
+
+        get('/cached/prices?region=au')
+        self.assertEqual(['prices', 'stale', 'prices'], calls)
+
+        web.cache.invalidate()
+        self.assertEqual(0, len(web.cache.entries))
+
+    def test_stale_while_revalidate(self):
+        get('/cached/stale')
+
+        # Stale, sent straight away and refreshed once it has been sent
+        resp = get('/cached/stale')
+        self.assertEqual(1, json.loads(resp.get_data())['call'])
+        self.assertEqual(1, len(calls))
+
+        resp.close()
+        self.assertEqual(2, len(calls))
+
+        resp = get('/cached/stale')
+        self.assertEqual(2, json.loads(resp.get_data())['call'])
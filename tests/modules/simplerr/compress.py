@@ -0,0 +1,93 @@
+# Imports {{{1
+import gzip
+import zlib
+
+from unittest import TestCase
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+from simplerr.compress import Compressor
+from simplerr.dispatcher import dispatcher, WebEvents
+
+
+def create_env(encoding='gzip'):
+    builder = EnvironBuilder(path='/')
+
+    if encoding is not None:
+        builder.headers['Accept-Encoding'] = encoding
+
+    return builder.get_environ()
+
+
+PAYLOAD = b'{"results": [' + b', '.join([b'{"id": 1, "name": "pet"}'] * 100) + b']}'
+
+
+# Compressor  {{{1
+class CompressorTests(TestCase):
+
+    def setUp(self):
+        self.compressor = Compressor(threshold=100)
+
+    def json_response(self, data=PAYLOAD):
+        return Response(data, mimetype='application/json')
+
+    def test_compressed(self):
+        resp = self.compressor(create_env(), self.json_response())
+
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertEqual('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(len(resp.get_data()), resp.content_length)
+        self.assertEqual(PAYLOAD, gzip.decompress(resp.get_data()))
+
+    def test_deflate(self):
+        resp = self.compressor(create_env('deflate'), self.json_response())
+
+        self.assertEqual('deflate', resp.headers['Content-Encoding'])
+        self.assertEqual(PAYLOAD, zlib.decompress(resp.get_data()))
+
+    def test_threshold(self):
+        resp = self.compressor(create_env(), self.json_response(b'{}'))
+
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(b'{}', resp.get_data())
+
+    def test_not_accepted(self):
+        resp = self.compressor(create_env(None), self.json_response())
+
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual('Accept-Encoding', resp.headers['Vary'])
+
+    def test_skipped(self):
+        image = Response(PAYLOAD, mimetype='image/png')
+        self.assertNotIn('Content-Encoding', self.compressor(create_env(), image).headers)
+
+        passthrough = self.json_response()
+        passthrough.direct_passthrough = True
+        self.assertNotIn('Content-Encoding', self.compressor(create_env(), passthrough).headers)
+
+    def test_streamed(self):
+        def rows():
+            yield '{"results": ['
+            for i in range(100):
+                yield '{"id": %d}, ' % i
+            yield '{}]}'
+
+        resp = self.compressor(create_env(), Response(rows(), mimetype='application/json'))
+
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertIsNone(resp.content_length)
+        self.assertTrue(gzip.decompress(resp.get_data()).endswith(b'{"id": 99}, {}]}'))
+
+    def test_weak_etag(self):
+        resp = self.json_response()
+        resp.set_etag('abc')
+
+        resp = self.compressor(create_env(), resp)
+        self.assertEqual(('abc', True), resp.get_etag())
+
+    def test_dispatcher_finish(self):
+        app = dispatcher('.', WebEvents(), self.compressor)
+        request = app.make_request(create_env())
+
+        resp = app.finish(request, self.json_response())
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
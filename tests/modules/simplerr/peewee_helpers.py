@@ -0,0 +1,102 @@
+# Imports {{{1
+from unittest import TestCase
+
+import peewee
+
+from simplerr.peewee import model_to_dict, models_to_dicts
+
+
+class CountingDatabase(peewee.SqliteDatabase):
+
+    queries = 0
+
+    def execute_sql(self, *args, **kwargs):
+        self.queries += 1
+        return super(CountingDatabase, self).execute_sql(*args, **kwargs)
+
+
+db = CountingDatabase(':memory:')
+
+
+class Author(peewee.Model):
+    name = peewee.CharField()
+
+    class Meta:
+        database = db
+
+
+class Book(peewee.Model):
+    title = peewee.CharField()
+    author = peewee.ForeignKeyField(Author)
+
+    class Meta:
+        database = db
+
+
+class Review(peewee.Model):
+    book = peewee.ForeignKeyField(Book)
+    stars = peewee.IntegerField()
+
+    class Meta:
+        database = db
+
+
+class Node(peewee.Model):
+    name = peewee.CharField()
+    parent = peewee.ForeignKeyField('self', null=True)
+
+    class Meta:
+        database = db
+
+
+# Basic Peewee  {{{1
+class BasicPeeweeTests(TestCase):
+
+    def setUp(self):
+        db.create_tables([Author, Book, Review, Node])
+
+        authors = [Author.create(name='author {}'.format(i)) for i in range(3)]
+
+        for i in range(30):
+            book = Book.create(title='book {}'.format(i), author=authors[i % 3])
+            Review.create(book=book, stars=i % 5)
+
+        db.queries = 0
+
+    def tearDown(self):
+        db.drop_tables([Author, Book, Review, Node])
+
+    def test_model_to_dict(self):
+        review = Review.get_by_id(1)
+
+        expect = {
+            'id': 1,
+            'book': {'id': 1, 'title': 'book 0', 'author': {'id': 1, 'name': 'author 0'}},
+            'stars': 0,
+        }
+        self.assertEqual(expect, model_to_dict(review))
+
+    def test_max_depth(self):
+        review = Review.get_by_id(1)
+
+        self.assertEqual({'id': 1, 'book': 1, 'stars': 0}, model_to_dict(review, max_depth=0))
+        self.assertEqual(1, model_to_dict(review, max_depth=1)['book']['author'])
+
+    def test_batched_queries(self):
+        rows = models_to_dicts(Review.select())
+
+        # One query each for reviews, books and authors
+        self.assertEqual(3, db.queries)
+        self.assertEqual(30, len(rows))
+        self.assertEqual('author 2', rows[29]['book']['author']['name'])
+
+    def test_cycles(self):
+        a = Node.create(name='a')
+        b = Node.create(name='b', parent=a)
+        a.parent = b
+        a.save()
+
+        rows = models_to_dicts(Node.select().order_by(Node.id))
+
+        self.assertEqual({'id': 2, 'name': 'b', 'parent': 1}, rows[0]['parent'])
+        self.assertEqual({'id': 1, 'name': 'a', 'parent': 2}, rows[1]['parent'])
@@ -1,7 +1,11 @@
 # Imports {{{1
 from unittest import TestCase
-from simplerr.script import script
+from werkzeug.exceptions import NotFound
+from simplerr.script import script, ScriptIndex, ModuleCache
+from simplerr.web import web
 import os
+import tempfile
+import threading
 
 
 # Basic Template  {{{1
@@ -38,3 +42,169 @@ class BasicScriptTests(TestCase):
         self.assertEqual(expect, module.__description__)
 
 
+# Script Index  {{{1
+class ScriptIndexTests(TestCase):
+
+    def setUp(self):
+        self.cwd = os.path.dirname(__file__)
+        self.index = script.index
+        script.index = ScriptIndex(revalidate=0)
+
+    def tearDown(self):
+        script.index = self.index
+
+    def test_hit_after_miss(self):
+        script(self.cwd, '/assets/scripts/sc_hello_world').get_script()
+        script(self.cwd, '/assets/scripts/sc_hello_world').get_script()
+
+        self.assertEqual(1, script.index.misses)
+        self.assertEqual(1, script.index.hits)
+
+    def test_negative_cache(self):
+        for i in range(2):
+            with self.assertRaises(NotFound):
+                script(self.cwd, '/assets/html/missing/deep/path').get_script()
+
+        self.assertEqual(1, script.index.misses)
+        self.assertEqual(1, script.index.hits)
+
+    def test_unique_deep_misses(self):
+        script.index = ScriptIndex()
+
+        for name in ('first', 'second', 'third'):
+            with self.assertRaises(NotFound):
+                script(self.cwd, '/assets/html/{}/deep/path'.format(name)).get_script()
+
+        # Only the folders on the way are listed, once
+        self.assertEqual(1, script.index.misses)
+        self.assertEqual(2, script.index.hits)
+        self.assertEqual(3, script.index.stats()['size'])
+
+    def test_invalidate_on_new_file(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            os.mkdir(os.path.join(cwd, 'app'))
+
+            with self.assertRaises(NotFound):
+                script(cwd, '/app/login').get_script()
+
+            with open(os.path.join(cwd, 'app', 'login.py'), 'w') as f:
+                f.write('')
+
+            # Folder mtime may not tick on coarse filesystems
+            os.utime(os.path.join(cwd, 'app'), ns=(0, 0))
+
+            path = script(cwd, '/app/login').get_script()
+            self.assertEqual(os.path.join(cwd, 'app', 'login.py'), path)
+
+
+# Module Cache  {{{1
+class ModuleCacheTests(TestCase):
+
+    def setUp(self):
+        self.cwd = os.path.dirname(__file__)
+        self.modules = script.modules
+        script.modules = ModuleCache()
+
+        self.destinations = web.destinations
+        web.destinations = []
+
+    def tearDown(self):
+        script.modules = self.modules
+        web.destinations = self.destinations
+
+    def test_module_reused(self):
+        first = script(self.cwd, '/assets/scripts/sc_hello_world').get_module()
+        second = script(self.cwd, '/assets/scripts/sc_hello_world').get_module()
+
+        self.assertIs(first, second)
+        self.assertEqual(1, script.modules.hits)
+
+    def test_module_reloaded_on_change(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            path = os.path.join(cwd, 'view.py')
+
+            with open(path, 'w') as f:
+                f.write('value = 1\n')
+
+            self.assertEqual(1, script(cwd, '/view').get_module().value)
+
+            with open(path, 'w') as f:
+                f.write('value = 22\n')
+
+            self.assertEqual(22, script(cwd, '/view').get_module().value)
+
+    def test_routes_per_script(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            with open(os.path.join(cwd, 'view.py'), 'w') as f:
+                f.write('from simplerr.web import web\n')
+                f.write('@web("/view")\n')
+                f.write('def view(request):\n')
+                f.write('    return "view"\n')
+
+            first = script(cwd, '/view').get_routes()
+            second = script(cwd, '/view').get_routes()
+
+            self.assertIs(first, second)
+            self.assertEqual(['/view'], [item.route for item in first.destinations])
+            self.assertEqual([], web.destinations)
+
+    def test_concurrent_load(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            path = os.path.join(cwd, 'view.py')
+            log = os.path.join(cwd, 'log')
+
+            with open(path, 'w') as f:
+                f.write('import time\n')
+                f.write('open({!r}, "a").write("x")\n'.format(log))
+                f.write('time.sleep(0.05)\n')
+
+            threads = [threading.Thread(target=script.load, args=(path,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            with open(log) as f:
+                self.assertEqual('x', f.read())
+
+
+# Preload  {{{1
+class PreloadTests(TestCase):
+
+    def setUp(self):
+        self.index = script.index
+        self.modules = script.modules
+        script.index = ScriptIndex()
+        script.modules = ModuleCache()
+
+    def tearDown(self):
+        script.index = self.index
+        script.modules = self.modules
+
+    def test_preload(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            os.mkdir(os.path.join(cwd, 'api'))
+            os.mkdir(os.path.join(cwd, '__pycache__'))
+
+            for name in ('index.py', 'api/users.py', '__pycache__/skip.py'):
+                with open(os.path.join(cwd, name), 'w') as f:
+                    f.write('from simplerr.web import web\n')
+                    f.write('@web("/{}")\n'.format(name))
+                    f.write('def view(request):\n')
+                    f.write('    return ""\n')
+
+            stats = script.preload(cwd)
+
+            self.assertEqual(2, stats['scripts'])
+            self.assertEqual(2, stats['routes'])
+            self.assertEqual([], stats['errors'])
+
+            # Resolved from the preloaded files, new files are not seen
+            with open(os.path.join(cwd, 'new.py'), 'w') as f:
+                f.write('')
+
+            path = script(cwd, '/new').get_script()
+            self.assertEqual(os.path.join(cwd, 'index.py'), path)
+
+            path = script(cwd, '/api/users/1').get_script()
+            self.assertEqual(os.path.join(cwd, 'api', 'users.py'), path)
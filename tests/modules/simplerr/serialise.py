@@ -0,0 +1,58 @@
+# Imports {{{1
+import json
+
+from datetime import datetime, date
+from decimal import Decimal
+from uuid import UUID
+from unittest import TestCase
+
+from simplerr import serialise
+from simplerr.serialise import tojson, register, resolved
+
+
+class Point(object):
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Named(object):
+
+    def to_dict(self):
+        return {'name': 'named'}
+
+
+# Basic Serialise  {{{1
+class BasicSerialiseTests(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        serialise.serialisers.pop(Point, None)
+        resolved.clear()
+
+    def test_native(self):
+        data = {'a': [1, 2.5, 'three', None, True]}
+        self.assertEqual(data, json.loads(tojson(data)))
+
+    def test_dates(self):
+        data = [datetime(2020, 1, 2, 3, 4, 5), date(2020, 1, 2)]
+        self.assertEqual(['2020-01-02 03:04:05', '2020-01-02'], json.loads(tojson(data)))
+
+    def test_decimal_and_uuid(self):
+        uuid = UUID('12345678123456781234567812345678')
+        data = [Decimal('1.10'), uuid]
+        self.assertEqual(['1.10', str(uuid)], json.loads(tojson(data)))
+
+    def test_to_dict(self):
+        self.assertEqual({'name': 'named'}, json.loads(tojson(Named())))
+
+    def test_register(self):
+        register(Point, lambda obj: [obj.x, obj.y])
+        self.assertEqual([[1, 2]], json.loads(tojson([Point(1, 2)])))
+
+    def test_resolution_cached(self):
+        tojson([Named(), Named()])
+        self.assertIn(Named, resolved)
@@ -0,0 +1,119 @@
+# Imports {{{1
+import os
+import time
+import signal
+import urllib.error
+import urllib.request
+
+from unittest import TestCase
+
+from simplerr.server import PreforkServer, rss
+
+
+def app(environ, start_response):
+    # A worker that crashes mid request, the master should replace it
+    if environ['PATH_INFO'] == '/crash':
+        os._exit(1)
+
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+
+# Prefork Server  {{{1
+class PreforkServerTests(TestCase):
+
+    def setUp(self):
+        self.server = PreforkServer(app, '127.0.0.1', 0, workers=2, max_requests=1)
+        self.server.poll_interval = 0.05
+        self.server.min_lifetime = 0.05
+
+        # Bound here so the port is known before the master is forked
+        self.port = self.server.bind().getsockname()[1]
+
+        self.master = os.fork()
+        if self.master == 0:
+            status = 0
+            try:
+                self.server.serve_forever()
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+
+        self.server.socket.close()
+
+    def tearDown(self):
+        if self.master is not None:
+            self.stop()
+
+    def get(self, path='/'):
+        url = 'http://127.0.0.1:{}{}'.format(self.port, path)
+
+        with urllib.request.urlopen(url, timeout=5) as f:
+            return int(f.read())
+
+    def stop(self, signum=signal.SIGTERM):
+        os.kill(self.master, signum)
+
+        # Workers finish their current request then the master exits
+        for _ in range(100):
+            pid, status = os.waitpid(self.master, os.WNOHANG)
+            if pid:
+                self.master = None
+                return status
+            time.sleep(0.05)
+
+        os.kill(self.master, signal.SIGKILL)
+        os.waitpid(self.master, 0)
+        self.master = None
+
+        self.fail('Master did not stop')
+
+    def test_max_requests(self):
+        pids = [self.get() for _ in range(4)]
+
+        # Every worker retires after one request and is replaced
+        self.assertEqual(4, len(set(pids)))
+        self.assertNotIn(self.master, pids)
+
+    def test_crashed_worker_replaced(self):
+        with self.assertRaises((urllib.error.URLError, ConnectionError)):
+            self.get('/crash')
+
+        self.assertIsInstance(self.get(), int)
+
+    def test_reload(self):
+        before = self.get()
+
+        os.kill(self.master, signal.SIGHUP)
+        time.sleep(0.2)
+
+        self.assertNotEqual(before, self.get())
+
+    def test_stop(self):
+        self.get()
+
+        status = self.stop()
+        self.assertTrue(os.WIFEXITED(status))
+        self.assertEqual(0, os.WEXITSTATUS(status))
+
+        with self.assertRaises((urllib.error.URLError, ConnectionError)):
+            self.get()
+
+    def test_master_killed(self):
+        self.get()
+
+        # Workers notice the master is gone and exit, rather than being left
+        # serving on the socket
+        self.stop(signal.SIGKILL)
+        time.sleep(0.5)
+
+        with self.assertRaises((urllib.error.URLError, ConnectionError)):
+            self.get()
+
+
+# RSS  {{{1
+class RSSTests(TestCase):
+
+    def test_rss(self):
+        self.assertGreater(rss(), 0)
@@ -0,0 +1,283 @@
+# Imports {{{1
+import os
+import time
+import tempfile
+import threading
+
+from unittest import TestCase, skipIf, mock
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+from simplerr.session import MemorySessionStore, SqliteSessionStore, CookieSessionStore, Fernet
+
+
+def create_request(cookie=None):
+    builder = EnvironBuilder(path='/')
+
+    if cookie is not None:
+        builder.headers['Cookie'] = cookie
+
+    return Request(builder.get_environ())
+
+
+# Memory Session Store  {{{1
+class MemorySessionStoreTests(TestCase):
+
+    def setUp(self):
+        self.store = MemorySessionStore(maxsize=2)
+
+    def tearDown(self):
+        self.store.stop()
+
+    def test_round_trip(self):
+        session = self.store.new()
+        session['user'] = 'john'
+        self.store.save(session)
+
+        self.assertEqual('john', self.store.get(session.sid)['user'])
+
+    def test_lru_eviction(self):
+        sessions = [self.store.new() for i in range(3)]
+
+        for session in sessions:
+            session['n'] = 1
+            self.store.save(session)
+
+        self.assertNotIn('n', self.store.get(sessions[0].sid))
+        self.assertIn('n', self.store.get(sessions[2].sid))
+
+    def test_expiry(self):
+        self.store.sessions.ttl = 0.01
+
+        session = self.store.new()
+        session['n'] = 1
+        self.store.save(session)
+        time.sleep(0.02)
+
+        self.assertEqual(1, self.store.sessions.sweep())
+        self.assertNotIn('n', self.store.get(session.sid))
+
+    def test_signals(self):
+        request = create_request()
+        self.store.pre_response(request)
+        request.session['n'] = 1
+
+        response = Response()
+        self.store.post_response(request, response)
+
+        cookie = response.headers['Set-Cookie'].split(';')[0]
+        request = create_request(cookie)
+        self.store.pre_response(request)
+
+        self.assertEqual(1, request.session['n'])
+
+    def test_write_behind(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'sessions')
+
+            store = MemorySessionStore(path=path)
+            session = store.new()
+            session['n'] = 1
+            store.save(session)
+            store.stop()
+
+            restored = MemorySessionStore(path=path)
+            self.assertEqual(1, restored.get(session.sid)['n'])
+            restored.stop()
+
+    def test_file_per_process(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'sessions')
+            sids = []
+
+            # As forked workers, each with its own sessions
+            stores = [MemorySessionStore(path=path), MemorySessionStore(path=path)]
+
+            for pid, store in zip((100, 200), stores):
+                session = store.new()
+                session['pid'] = pid
+                store.save(session)
+                sids.append(session.sid)
+
+                with mock.patch('os.getpid', return_value=pid):
+                    store.stop()
+
+            self.assertEqual(['sessions.100', 'sessions.200'], sorted(os.listdir(folder)))
+
+            restored = MemorySessionStore(path=path)
+
+            self.assertEqual([100, 200], [restored.get(sid)['pid'] for sid in sids])
+            self.assertEqual(['sessions'], os.listdir(folder))
+            restored.stop()
+
+    def test_lazy_load(self):
+        store = self.store
+        calls = []
+
+        def get(sid):
+            calls.append(sid)
+            return MemorySessionStore.get(store, sid)
+
+        store.get = get
+
+        request = create_request('sessionfast=abc')
+        store.pre_response(request)
+        store.post_response(request, Response())
+        self.assertEqual([], calls)
+
+        request = create_request('sessionfast=abc')
+        store.pre_response(request)
+        request.session.get('n')
+        store.post_response(request, Response())
+        self.assertEqual(['abc'], calls)
+
+
+# Sqlite Session Store  {{{1
+class SqliteSessionStoreTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = SqliteSessionStore(os.path.join(self.folder.name, 'sessions.db'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_round_trip(self):
+        session = self.store.new()
+        session['user'] = 'john'
+        self.store.save(session)
+
+        self.assertEqual('john', self.store.get(session.sid)['user'])
+        self.assertEqual([session.sid], self.store.list())
+
+        self.store.delete(session)
+        self.assertNotIn('user', self.store.get(session.sid))
+
+    def test_expiry(self):
+        session = self.store.new()
+        session['n'] = 1
+        self.store.save(session)
+
+        self.store.connection().execute("UPDATE sessions SET expires = 0")
+        self.assertNotIn('n', self.store.get(session.sid))
+
+        # Expired rows are removed in bulk, at most once per interval
+        self.store.clean()
+        count = self.store.connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        self.assertEqual(0, count)
+
+    def test_connection_per_thread(self):
+        connections = []
+
+        session = self.store.new()
+        session['n'] = 1
+        self.store.save(session)
+
+        def worker():
+            connections.append(self.store.connection())
+            connections.append(self.store.get(session.sid)['n'])
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(self.store.connection(), connections[0])
+        self.assertEqual(1, connections[1])
+
+    def test_signals(self):
+        request = create_request()
+        self.store.pre_response(request)
+        request.session['n'] = 1
+
+        response = Response()
+        self.store.post_response(request, response)
+
+        cookie = response.headers['Set-Cookie'].split(';')[0]
+        request = create_request(cookie)
+        self.store.pre_response(request)
+
+        self.assertEqual(1, request.session['n'])
+
+
+# Cookie Session Store  {{{1
+def round_trip(store, cookie=None, **data):
+    request = create_request(cookie)
+    store.pre_response(request)
+    request.session.update(data)
+
+    response = Response()
+    store.post_response(request, response)
+
+    cookie = response.headers['Set-Cookie'].split(';')[0]
+    request = create_request(cookie)
+    store.pre_response(request)
+
+    return cookie, request.session
+
+
+class CookieSessionStoreTests(TestCase):
+
+    def setUp(self):
+        self.store = CookieSessionStore('secret')
+
+    def test_round_trip(self):
+        cookie, session = round_trip(self.store, user='john')
+
+        self.assertTrue(cookie.startswith('sessionfast=c.'))
+        self.assertEqual('john', session['user'])
+
+    def test_tampered(self):
+        cookie, session = round_trip(self.store, user='john')
+
+        other = CookieSessionStore('other')
+        request = create_request(cookie)
+        other.pre_response(request)
+
+        self.assertNotIn('user', request.session)
+
+    def test_expiry(self):
+        value = self.store.encode({'n': 1})
+        self.assertEqual({'n': 1}, self.store.get(value))
+
+        self.store.expire = -1
+        self.assertEqual({}, self.store.get(value))
+
+    def test_compress(self):
+        data = {'text': 'a' * 1000}
+
+        self.assertLess(len(self.store.encode(data)), 200)
+
+    def test_fallback(self):
+        memory = MemorySessionStore()
+        store = CookieSessionStore('secret', fallback=memory, max_size=100)
+
+        cookie, session = round_trip(store, text=os.urandom(100).hex())
+        self.assertTrue(cookie.startswith('sessionfast=s.'))
+        self.assertEqual(1, len(memory.sessions))
+
+        # Shrinking the session moves it back to the cookie
+        request = create_request(cookie)
+        store.pre_response(request)
+        request.session['text'] = 'a'
+
+        response = Response()
+        store.post_response(request, response)
+
+        self.assertIn('sessionfast=c.', response.headers['Set-Cookie'])
+        self.assertEqual(0, len(memory.sessions))
+        memory.stop()
+
+    def test_too_large(self):
+        store = CookieSessionStore('secret', max_size=100)
+
+        with self.assertRaises(ValueError):
+            round_trip(store, text=os.urandom(100).hex())
+
+    @skipIf(Fernet is None, 'cryptography is not installed')
+    def test_encrypt(self):
+        store = CookieSessionStore('secret', encrypt=True)
+        cookie, session = round_trip(store, user='john')
+
+        self.assertTrue(cookie.startswith('sessionfast=e.'))
+        self.assertNotIn('john', cookie)
+        self.assertEqual('john', session['user'])
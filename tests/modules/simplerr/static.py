@@ -0,0 +1,425 @@
+# Imports {{{1
+import os
+import gzip
+import tempfile
+import threading
+import urllib.request
+
+from unittest import TestCase, mock
+from werkzeug.test import EnvironBuilder
+from werkzeug.serving import make_server
+
+from simplerr import static
+from simplerr.assets import Bundle
+from simplerr.dispatcher import Simplerr
+from simplerr.static import send_file, Offload
+from simplerr.server import WorkerRequestHandler, SendfileWrapper
+from simplerr.compress import negotiate, precompress
+
+
+def create_env(path='/file.txt', **headers):
+    builder = EnvironBuilder(path=path)
+
+    for name, value in headers.items():
+        builder.headers[name.replace('_', '-')] = value
+
+    return builder.get_environ()
+
+
+def body(response):
+    response.direct_passthrough = False
+    return response.get_data()
+
+
+# Send File  {{{1
+class SendFileTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'file.txt')
+
+        with open(self.path, 'wb') as f:
+            f.write(b'0123456789')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_full(self):
+        resp = send_file(create_env(), self.path)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(b'0123456789', body(resp))
+        self.assertEqual(10, resp.content_length)
+        self.assertEqual('text/plain;charset=utf-8', resp.headers['Content-Type'])
+        self.assertIsNotNone(resp.headers.get('ETag'))
+        self.assertIsNotNone(resp.headers.get('Last-Modified'))
+
+    def test_missing(self):
+        self.assertEqual(404, send_file(create_env(), self.path + '.nope').status_code)
+        self.assertEqual(404, send_file(create_env(), self.folder.name).status_code)
+
+    def test_if_none_match(self):
+        etag = send_file(create_env(), self.path).headers['ETag']
+        resp = send_file(create_env(If_None_Match=etag), self.path)
+
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b'', resp.get_data())
+
+    def test_if_modified_since(self):
+        modified = send_file(create_env(), self.path).headers['Last-Modified']
+        resp = send_file(create_env(If_Modified_Since=modified), self.path)
+
+        self.assertEqual(304, resp.status_code)
+
+    def test_single_range(self):
+        resp = send_file(create_env(Range='bytes=2-4'), self.path)
+
+        self.assertEqual(206, resp.status_code)
+        self.assertEqual(b'234', body(resp))
+        self.assertEqual('bytes 2-4/10', resp.headers['Content-Range'])
+        self.assertEqual(3, resp.content_length)
+
+    def test_suffix_range(self):
+        resp = send_file(create_env(Range='bytes=-3'), self.path)
+
+        self.assertEqual(b'789', body(resp))
+
+    def test_multiple_ranges(self):
+        resp = send_file(create_env(Range='bytes=0-1,5-6'), self.path)
+
+        self.assertEqual(206, resp.status_code)
+        self.assertTrue(resp.headers['Content-Type'].startswith('multipart/byteranges; boundary='))
+
+        data = body(resp)
+        self.assertEqual(resp.content_length, len(data))
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01', data)
+        self.assertIn(b'Content-Range: bytes 5-6/10\r\n\r\n56', data)
+
+    def test_unsatisfiable_range(self):
+        resp = send_file(create_env(Range='bytes=20-30'), self.path)
+
+        self.assertEqual(416, resp.status_code)
+        self.assertEqual('bytes */10', resp.headers['Content-Range'])
+
+    def test_if_range(self):
+        resp = send_file(create_env(Range='bytes=2-4', If_Range='"stale"'), self.path)
+        self.assertEqual(200, resp.status_code)
+
+        etag = resp.headers['ETag']
+        resp = send_file(create_env(Range='bytes=2-4', If_Range=etag), self.path)
+        self.assertEqual(206, resp.status_code)
+
+
+# Hot Files  {{{1
+class HotFileTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'video.bin')
+        self.data = os.urandom(1000)
+
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+        static.hot_files.clear()
+        static.mapped_files.clear()
+        self.hot_max_size = static.HOT_MAX_SIZE
+
+    def tearDown(self):
+        static.HOT_MAX_SIZE = self.hot_max_size
+        self.folder.cleanup()
+
+    def test_cached(self):
+        send_file(create_env(), self.path)
+        hits = static.hot_files.hits
+        resp = send_file(create_env(), self.path)
+
+        self.assertEqual(self.data, body(resp))
+        self.assertEqual(hits + 1, static.hot_files.hits)
+        self.assertEqual(1000, static.hot_files.bytes)
+
+    def test_not_modified_unread(self):
+        etag = send_file(create_env(), self.path).headers['ETag']
+        static.hot_files.clear()
+
+        resp = send_file(create_env(If_None_Match=etag), self.path)
+
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(0, len(static.hot_files))
+
+    def test_invalidated(self):
+        send_file(create_env(), self.path)
+
+        with open(self.path, 'wb') as f:
+            f.write(b'changed')
+
+        self.assertEqual(b'changed', body(send_file(create_env(), self.path)))
+
+    def test_mapped(self):
+        static.HOT_MAX_SIZE = 100
+        static.MMAP_CHUNK_SIZE, chunk_size = 300, static.MMAP_CHUNK_SIZE
+
+        try:
+            resp = send_file(create_env(), self.path)
+            self.assertEqual(self.data, body(resp))
+            self.assertEqual(0, static.hot_files.bytes)
+            self.assertEqual(1000, static.mapped_files.bytes)
+
+            resp = send_file(create_env(Range='bytes=100-799'), self.path)
+            self.assertEqual(self.data[100:800], body(resp))
+        finally:
+            static.MMAP_CHUNK_SIZE = chunk_size
+
+    def test_maps_closed(self):
+        static.HOT_MAX_SIZE = 100
+        static.mapped_files.maxsize, maxsize = 2, static.mapped_files.maxsize
+
+        try:
+            entries = []
+
+            for i in range(4):
+                path = os.path.join(self.folder.name, '{}.bin'.format(i))
+                with open(path, 'wb') as f:
+                    f.write(self.data)
+
+                self.assertEqual(self.data[:10], body(send_file(create_env(Range='bytes=0-9'), path)))
+                entries.append(static.mapped_files.get(path))
+
+            self.assertEqual(2, len(static.mapped_files))
+            self.assertEqual([None, None], [entry.map for entry in entries[:2]])
+            self.assertIsNotNone(entries[3].map)
+        finally:
+            static.mapped_files.maxsize = maxsize
+
+    def test_map_in_use(self):
+        static.HOT_MAX_SIZE = 100
+        static.MMAP_CHUNK_SIZE, chunk_size = 300, static.MMAP_CHUNK_SIZE
+
+        try:
+            resp = send_file(create_env(), self.path)
+            chunks = iter(resp.response)
+            first = next(chunks)
+            entry = static.mapped_files.get(self.path)
+
+            # Evicted mid response, the map stays open until it's sent
+            static.mapped_files.clear()
+            self.assertIsNotNone(entry.map)
+            self.assertEqual(self.data, first + b''.join(chunks))
+            self.assertIsNone(entry.map)
+        finally:
+            static.MMAP_CHUNK_SIZE = chunk_size
+
+
+# Offload  {{{1
+class OffloadTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'big file.bin')
+
+        with open(self.path, 'wb') as f:
+            f.write(os.urandom(1000))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_location(self):
+        offload = Offload(root=self.folder.name, prefix='/_files/')
+
+        self.assertEqual('/_files/big%20file.bin', offload.location(self.path))
+        self.assertIsNone(offload.location('/etc/passwd'))
+
+        offload = Offload('X-Sendfile', root=self.folder.name)
+        self.assertEqual(self.path, offload.location(self.path))
+
+    def test_accel_redirect(self):
+        offload = Offload(root=self.folder.name, prefix='/_files')
+        resp = send_file(create_env(), self.path, offload=offload)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('/_files/big%20file.bin', resp.headers['X-Accel-Redirect'])
+        self.assertEqual(b'', resp.get_data())
+
+        resp = send_file(create_env(If_None_Match=resp.headers['ETag']), self.path, offload=offload)
+        self.assertEqual(304, resp.status_code)
+        self.assertNotIn('X-Accel-Redirect', resp.headers)
+
+
+# Sendfile  {{{1
+class SendfileTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'video.bin')
+        self.data = os.urandom(static.HOT_MAX_SIZE + 1000)
+
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def serve(self, app, wrap=True):
+        if wrap:
+            app = WorkerRequestHandler.application(app)
+
+        server = make_server('127.0.0.1', 0, app, request_handler=WorkerRequestHandler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+
+        try:
+            url = 'http://127.0.0.1:{}/video.bin'.format(server.server_port)
+            with urllib.request.urlopen(url) as f:
+                return f.read()
+        finally:
+            thread.join()
+            server.server_close()
+
+    def test_sendfile(self):
+        responses = []
+
+        def app(environ, start_response):
+            response = send_file(environ, self.path)
+            responses.append(response)
+            return response(environ, start_response)
+
+        self.assertEqual(self.data, self.serve(app))
+        self.assertIsInstance(responses[0].response, SendfileWrapper)
+
+    def test_middleware(self):
+        # Middleware iterating the body gets the file, not a sendfile
+        def app(environ, start_response):
+            return send_file(environ, self.path)(environ, start_response)
+
+        def collect(environ, start_response):
+            return [b''.join(app(environ, start_response))]
+
+        self.assertEqual(self.data, self.serve(collect))
+
+    def serve_site(self, **kwargs):
+        with open(os.path.join(self.folder.name, 'index.py'), 'w') as f:
+            f.write('from simplerr.web import web\n')
+            f.write('@web("/video.bin", file=True)\n')
+            f.write('def video(request):\n')
+            f.write('    return "video.bin"\n')
+
+        root = Bundle.root
+        sent = []
+        sendfile = WorkerRequestHandler.sendfile
+
+        def spy(handler, wrapper):
+            sent.append(wrapper)
+            return sendfile(handler, wrapper)
+
+        try:
+            with mock.patch('simplerr.dispatcher.run_simple') as run_simple:
+                Simplerr(self.folder.name, '127.0.0.1', 0, use_session_store=False, **kwargs).serve()
+
+            (hostname, port, app), options = run_simple.call_args
+            self.assertIs(WorkerRequestHandler, options['request_handler'])
+
+            with mock.patch.object(WorkerRequestHandler, 'sendfile', spy):
+                return self.serve(app, wrap=False), sent
+        finally:
+            Bundle.root = root
+
+    def test_serve(self):
+        data, sent = self.serve_site()
+
+        self.assertEqual(self.data, data)
+        self.assertEqual(1, len(sent))
+
+    def test_serve_debugger(self):
+        data, sent = self.serve_site(use_debugger=True)
+
+        self.assertEqual(self.data, data)
+        self.assertEqual([], sent)
+
+    def test_chunked(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/octet-stream')])
+            return environ['wsgi.file_wrapper'](open(self.path, 'rb'))
+
+        self.assertEqual(self.data, self.serve(app))
+
+
+# Compression  {{{1
+class CompressedFileTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'page.html')
+        self.data = b'<p>Hello World</p>' * 100
+
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+        static.variants.clear()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_negotiate(self):
+        self.assertEqual('br', negotiate({'HTTP_ACCEPT_ENCODING': 'gzip, br'}))
+        self.assertEqual('gzip', negotiate({'HTTP_ACCEPT_ENCODING': 'gzip, br;q=0.5'}))
+        self.assertEqual('gzip', negotiate({'HTTP_ACCEPT_ENCODING': '*'}, ['gzip']))
+        self.assertIsNone(negotiate({'HTTP_ACCEPT_ENCODING': 'gzip;q=0'}))
+        self.assertIsNone(negotiate({}))
+
+    def test_identity(self):
+        resp = send_file(create_env('/page.html'), self.path)
+
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(self.data, body(resp))
+
+    def test_precompressed(self):
+        stats = precompress(self.folder.name, ['gzip'])
+        self.assertEqual(1, stats['written'])
+
+        # Up to date copies are left alone
+        self.assertEqual(0, precompress(self.folder.name, ['gzip'])['written'])
+
+        resp = send_file(create_env('/page.html', Accept_Encoding='gzip'), self.path)
+
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertEqual('Accept-Encoding', resp.headers['Vary'])
+        self.assertTrue(resp.headers['ETag'].endswith('-gzip"'))
+        self.assertEqual(self.data, gzip.decompress(body(resp)))
+        self.assertEqual(0, len(static.variants))
+
+    def test_stale_precompressed(self):
+        with open(self.path + '.gz', 'wb') as f:
+            f.write(gzip.compress(b'old'))
+
+        os.utime(self.path + '.gz', (0, 0))
+
+        resp = send_file(create_env('/page.html', Accept_Encoding='gzip'), self.path)
+        self.assertEqual(self.data, gzip.decompress(body(resp)))
+
+    def test_dynamic(self):
+        hits = static.variants.hits
+
+        for i in range(2):
+            resp = send_file(create_env('/page.html', Accept_Encoding='gzip'), self.path)
+            self.assertEqual(self.data, gzip.decompress(body(resp)))
+
+        self.assertEqual(hits + 1, static.variants.hits)
+
+    def test_dynamic_not_modified(self):
+        etag = send_file(create_env('/page.html', Accept_Encoding='gzip'), self.path).headers['ETag']
+        static.variants.clear()
+        static.hot_files.clear()
+
+        resp = send_file(create_env('/page.html', Accept_Encoding='gzip', If_None_Match=etag), self.path)
+
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(0, len(static.variants))
+        self.assertEqual(0, len(static.hot_files))
+
+    def test_range_uncompressed(self):
+        resp = send_file(create_env('/page.html', Accept_Encoding='gzip', Range='bytes=0-2'), self.path)
+
+        self.assertEqual(206, resp.status_code)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(b'<p>', body(resp))
@@ -1,15 +1,23 @@
 # Imports {{{1
-from unittest import TestCase
-from simplerr.template import T
+from unittest import TestCase, mock
+from click.testing import CliRunner
+from simplerr import assets
+from simplerr.assets import Bundle
+from simplerr.script import script, ScriptIndex, ModuleCache
+from simplerr.template import Template, RenderCache
+from simplerr.web import web
+from simplerr.__main__ import main
 
 import os
+import time
+import tempfile
 
 # Basic Template  {{{1
 class BasicTemplateTests(TestCase):
 
     def setUp(self):
        cwd = os.path.dirname(__file__)
-       self.renderrer = T(cwd)
+       self.renderrer = Template(cwd)
 
     def tearDown(self):
         pass
@@ -26,3 +34,176 @@ class BasicTemplateTests(TestCase):
         self.assertEqual(expect, rendered)
 
 
+
+
+# Precompile  {{{1
+class PrecompileTests(TestCase):
+
+    def setUp(self):
+        self.site = tempfile.TemporaryDirectory()
+        self.cache = tempfile.TemporaryDirectory()
+
+        os.mkdir(os.path.join(self.site.name, 'pages'))
+
+        for name, body in [('index.html', '{{ msg|upper }}'), ('pages/about.html', 'About'), ('view.py', '')]:
+            with open(os.path.join(self.site.name, name), 'w') as f:
+                f.write(body)
+
+    def tearDown(self):
+        self.site.cleanup()
+        self.cache.cleanup()
+
+    def test_precompile(self):
+        stats = Template(self.site.name, self.cache.name).precompile()
+
+        self.assertEqual(2, stats['templates'])
+        self.assertEqual([], stats['errors'])
+        self.assertEqual(2, len(os.listdir(self.cache.name)))
+
+    def test_bytecode_cache_reused(self):
+        Template(self.site.name, self.cache.name).precompile()
+
+        renderer = Template(self.site.name, self.cache.name)
+        renderer.env.compile = None  # Would fail if anything was compiled again
+
+        self.assertEqual('HI', renderer.render('index.html', {'msg': 'hi'}))
+
+    def test_errors(self):
+        with open(os.path.join(self.site.name, 'broken.html'), 'w') as f:
+            f.write('{% if %}')
+
+        stats = Template(self.site.name).precompile()
+
+        self.assertEqual(2, stats['templates'])
+        self.assertEqual('broken.html', stats['errors'][0][0])
+
+    def test_filters_shared(self):
+        renderer = Template(self.site.name)
+        Template.filters['shout'] = lambda s: s + '!'
+
+        try:
+            self.assertIs(Template.filters, web.filters)
+            self.assertEqual('hi!', renderer.env.from_string('{{ "hi"|shout }}').render())
+        finally:
+            del Template.filters['shout']
+
+    def test_cli(self):
+        result = CliRunner().invoke(main, ['compile-templates', self.site.name, '--cache', self.cache.name, '--no-load-scripts'])
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('Compiled 2 templates', result.output)
+
+    def compile_scripts(self, source):
+        with open(os.path.join(self.site.name, 'view.py'), 'w') as f:
+            f.write(source)
+
+        root = Bundle.root
+
+        try:
+            with mock.patch.object(script, 'index', ScriptIndex()), mock.patch.object(script, 'modules', ModuleCache()):
+                return CliRunner().invoke(main, ['compile-templates', self.site.name, '--cache', self.cache.name])
+        finally:
+            Bundle.root = root
+            assets.bundles.pop('cli_js', None)
+            assets.urls.pop('cli_js', None)
+
+    def test_cli_bundles(self):
+        os.mkdir(os.path.join(self.site.name, 'static'))
+
+        with open(os.path.join(self.site.name, 'static', 'app.js'), 'w') as f:
+            f.write('var a = 1;')
+
+        result = self.compile_scripts(
+            'from simplerr.web import web\n'
+            '@web.js("cli_js", source_dir="/static")\n'
+            'def cli_js():\n'
+            '    yield "app.js"\n'
+        )
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertTrue(any(name.startswith('cli_js.') for name in os.listdir(os.path.join(self.site.name, 'static'))))
+
+
+    def test_cli_script_errors(self):
+        result = self.compile_scripts('raise RuntimeError("broken")\n')
+
+        self.assertEqual(1, result.exit_code, result.output)
+        self.assertIn('Failed to load', result.output)
+        self.assertIn('Compiled 2 templates', result.output)
+
+
+# Render Cache  {{{1
+class FakeRequest(object):
+    def __init__(self, path):
+        self.path = path
+
+
+class RenderCacheTests(TestCase):
+
+    def setUp(self):
+        self.site = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.site.name, 'page.html')
+        self.write('{{ msg }}')
+
+        self.renderer = Template(self.site.name)
+        self.cache = RenderCache()
+
+    def tearDown(self):
+        self.site.cleanup()
+
+    def write(self, body):
+        with open(self.path, 'w') as f:
+            f.write(body)
+
+    def render(self, data, vary=()):
+        return self.cache.render(self.renderer, 'page.html', data, vary)
+
+    def test_hit(self):
+        self.assertEqual('a', self.render({'msg': 'a', 'request': FakeRequest('/1')}))
+        self.assertEqual('a', self.render({'msg': 'a', 'request': FakeRequest('/2')}))
+        self.assertEqual('b', self.render({'msg': 'b'}))
+
+        self.assertEqual(1, self.cache.stats()['hits'])
+        self.assertEqual(2, self.cache.stats()['size'])
+
+    def test_vary(self):
+        self.render({'msg': 'a', 'request': FakeRequest('/1')}, ('path',))
+        self.render({'msg': 'a', 'request': FakeRequest('/2')}, ('path',))
+
+        self.assertEqual(0, self.cache.stats()['hits'])
+
+    def test_unhashable_context(self):
+        self.assertEqual('a', self.render({'msg': 'a', 'mixed': {1: 1, 'a': 2}}))
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def test_unknown_object(self):
+        class User(object):
+            def __init__(self, name, email):
+                self.name, self.email = name, email
+
+            def __str__(self):
+                return self.name
+
+        self.write('{{ user.email }}')
+
+        self.assertEqual('a@x', self.render({'user': User('bob', 'a@x')}))
+        self.assertEqual('b@x', self.render({'user': User('bob', 'b@x')}))
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def test_template_changed(self):
+        self.render({'msg': 'a'})
+
+        # Make sure the modified time moves on
+        time.sleep(0.01)
+        self.write('changed {{ msg }}')
+        os.utime(self.path, (time.time() + 5, time.time() + 5))
+
+        self.assertEqual('changed a', self.render({'msg': 'a'}))
+
+    def test_ttl(self):
+        self.cache = RenderCache(ttl=0.01)
+        self.render({'msg': 'a'})
+        time.sleep(0.02)
+        self.render({'msg': 'a'})
+
+        self.assertEqual(0, self.cache.stats()['hits'])
@@ -1,7 +1,9 @@
 import os
+import json
 
 from unittest import TestCase
 from simplerr.web import web
+import peewee
 from werkzeug.test import EnvironBuilder
 
 """
@@ -29,11 +31,46 @@ def status_response_fn(r):
     return {'error': 'msg'}, 400
 
 
+@web('/echo/<msg>')
+def echo_route_fn(r, msg):
+    return msg
+
+
 @web('/response/file', file=True)
 def file_response_fn(r):
     return 'assets/html/01_pure_html.html'
 
 
+db = peewee.SqliteDatabase(':memory:')
+
+
+class Pet(peewee.Model):
+    name = peewee.CharField()
+
+    class Meta:
+        database = db
+
+
+@web('/response/stream', stream=True)
+def stream_response_fn(r):
+    return Pet.select().order_by(Pet.id)
+
+
+@web('/response/template/stream', 'assets/html/02_echo.html', stream=True, stream_buffer=2)
+def stream_template_fn(r):
+    return {'msg': 'Hello Stream'}
+
+
+@web('/response/etag', etag=True)
+def etag_response_fn(r):
+    return {'price': 10}
+
+
+@web('/response/template/etag', 'assets/html/02_echo.html', etag=True)
+def etag_template_fn(r):
+    return {'msg': 'Hello ETag'}
+
+
 @web.filter('echo')
 def echo_fn(msg):
     return msg
@@ -74,6 +111,22 @@ class BasicWebTests(TestCase):
     #     rv = web.match(create_env('/simple'))
     #     self.assertEquals( rv.endpoint, 'simple_fn' )
 
+    def test_route_map_reused(self):
+        web.match(create_env('/simple'))
+        route_map = web.route_map
+
+        match = web.match(create_env('/response/dict'))
+        self.assertIs(route_map, web.route_map)
+        self.assertEqual(match.route, '/response/dict')
+
+    def test_match_args_per_request(self):
+        first = web.match(create_env('/echo/first'))
+        second = web.match(create_env('/echo/second'))
+
+        self.assertIsNot(first, second)
+        self.assertEqual(first.args, {'msg': 'first'})
+        self.assertEqual(second.args, {'msg': 'second'})
+
     def test_process_request(self):
         from werkzeug.wrappers import Request, Response
         env = create_env('/simple')
@@ -104,7 +157,7 @@ class BasicWebTests(TestCase):
         resp = web.process(req, env, self.cwd)
         self.assertIsInstance(resp, Response)
         self.assertEquals(resp.status_code, 400)
-        self.assertEquals(resp.data, b'{"error": "msg"}')
+        self.assertEquals(json.loads(resp.data), {"error": "msg"})
 
     def test_request_redirect(self):
         from werkzeug.wrappers import Response
@@ -130,3 +183,79 @@ class BasicWebTests(TestCase):
         # Need to disable direct passthrough for testing
         resp.direct_passthrough = False
         self.assertEqual(resp.data, b'Hello World\n')
+
+    def test_stream_model_select(self):
+        from werkzeug.wrappers import Request
+
+        db.create_tables([Pet])
+        Pet.insert_many([{'name': 'pet {}'.format(i)} for i in range(250)]).execute()
+
+        env = create_env('/response/stream')
+        resp = web.process(Request(env), env, self.cwd)
+
+        self.assertFalse(resp.is_sequence)
+        self.assertEqual(resp.headers['Content-Type'], 'application/json')
+
+        results = json.loads(resp.get_data())['results']
+        self.assertEqual(250, len(results))
+        self.assertEqual({'id': 250, 'name': 'pet 249'}, results[-1])
+
+    def test_stream_template(self):
+        from werkzeug.wrappers import Request
+
+        env = create_env('/response/template/stream')
+        resp = web.process(Request(env), env, self.cwd)
+
+        self.assertFalse(resp.is_sequence)
+        self.assertEqual(resp.headers['Content-Type'], 'text/html;charset=utf-8')
+        self.assertEqual(b'Hello Stream', resp.get_data())
+
+
+# ETags  {{{1
+class ETagTests(TestCase):
+
+    def setUp(self):
+        self.cwd = os.path.dirname(__file__)
+        self.etag = web.etag
+
+    def tearDown(self):
+        web.etag = self.etag
+
+    def process(self, path, **headers):
+        from werkzeug.wrappers import Request
+
+        env = EnvironBuilder(path=path, headers=headers).get_environ()
+        return web.process(Request(env), env, self.cwd)
+
+    def test_json(self):
+        resp = self.process('/response/etag')
+        etag = resp.headers['ETag']
+
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(etag.startswith('W/"'))
+
+        resp = self.process('/response/etag', **{'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(etag, resp.headers['ETag'])
+        self.assertEqual(b'', b''.join(resp.get_app_iter(create_env('/response/etag'))))
+
+    def test_template(self):
+        etag = self.process('/response/template/etag').headers['ETag']
+
+        resp = self.process('/response/template/etag', **{'If-None-Match': '"other", ' + etag})
+        self.assertEqual(304, resp.status_code)
+
+    def test_changed(self):
+        resp = self.process('/response/etag', **{'If-None-Match': 'W/"00000000-0"'})
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'price': 10}, json.loads(resp.data))
+
+    def test_global(self):
+        self.assertNotIn('ETag', self.process('/response/dict').headers)
+
+        web.etag = True
+        self.assertIn('ETag', self.process('/response/dict').headers)
+
+        # Streamed bodies aren't hashed
+        self.assertNotIn('ETag', self.process('/response/template/stream').headers)
@@ -19,6 +19,14 @@ class test_processor(object):
             'modules.simplerr.template',
             'modules.simplerr.script',
             'modules.simplerr.web',
+            'modules.simplerr.asgi',
+            'modules.simplerr.serialise',
+            'modules.simplerr.peewee_helpers',
+            'modules.simplerr.session',
+            'modules.simplerr.static',
+            'modules.simplerr.compress',
+            'modules.simplerr.bundles',
+            'modules.simplerr.cache',
             ]
 
         self.suite = unittest.TestSuite()